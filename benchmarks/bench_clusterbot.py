@@ -0,0 +1,186 @@
+"""
+Benchmarks of ClusterBot against an in-process fake Slack workspace.
+
+Run from the repository root with ``python -m benchmarks.bench_clusterbot``.
+Measures the overhead of ClusterBot itself (without network and rate limits) in
+messages per second, ``update_pbar()`` calls per second, the overhead per item of
+``track()``, uploads per second, the throughput of uploading a large file,
+constructor latency and memory per 10k lines appended to a message.
+Runs offline and exits with status 1 if any result misses its target. The
+timing targets are loosened by the factor in the ``BENCHMARK_TOLERANCE``
+environment variable (e.g. 3 on shared CI runners).
+"""
+
+import os
+import sys
+import timeit
+import tempfile
+import tracemalloc
+from time import perf_counter
+
+from clusterbot import ClusterBot
+from clusterbot.fake_slack import FakeSlack
+
+MIN_MESSAGES_PER_S = 20000
+MIN_PBAR_UPDATES_PER_S = 300000
+MAX_TRACK_US_PER_ITEM = 0.5
+MIN_UPLOADS_PER_S = 2000
+MIN_UPLOAD_MB_PER_S = 500
+MAX_CONSTRUCTOR_MS = 5
+MAX_KB_PER_10K_LINES = 500
+TOLERANCE = float(os.environ.get("BENCHMARK_TOLERANCE", "1"))
+
+N_MESSAGES = 5000
+N_PBAR_UPDATES = 200000
+N_TRACK_ITEMS = 10**6
+N_UPLOADS = 1000
+UPLOAD_MB = 64
+N_USERS = 1000
+N_LINES = 10000
+
+
+def make_bot(fake=None):
+    if fake is None:
+        fake = FakeSlack(n_users=N_USERS)
+    return ClusterBot(
+        user_id="U0000001",
+        slack_token="xoxb-benchmark",
+        user_config_file=os.devnull,
+        system_config_file=os.devnull,
+        use_cache=False,
+        transport=fake,
+    )
+
+
+def bench_messages():
+    # Messages sent per second, to a user whose conversation is open
+    bot = make_bot()
+    bot.send("warm up")
+    start = perf_counter()
+    for i in range(N_MESSAGES):
+        bot.send(f"Message {i}")
+    return N_MESSAGES / (perf_counter() - start)
+
+
+def bench_pbar_updates():
+    # ``update_pbar()`` calls per second, Slack updates are coalesced
+    bot = make_bot()
+    bot.init_pbar(N_PBAR_UPDATES)
+    start = perf_counter()
+    for _ in range(N_PBAR_UPDATES):
+        bot.update_pbar()
+    updates_per_s = N_PBAR_UPDATES / (perf_counter() - start)
+    bot.flush()
+    return updates_per_s
+
+
+def bench_track():
+    # Overhead in us per item of iterating over ``track()`` instead of the items
+    bot = make_bot()
+    items = range(N_TRACK_ITEMS)
+    start = perf_counter()
+    for _ in items:
+        pass
+    bare = perf_counter() - start
+    start = perf_counter()
+    for _ in bot.track(items):
+        pass
+    tracked = perf_counter() - start
+    bot.flush()
+    return (tracked - bare) / N_TRACK_ITEMS * 1e6
+
+
+def bench_uploads():
+    # Small in-memory files uploaded per second, each shared in its own message
+    bot = make_bot()
+    content = b"x" * 1024
+    start = perf_counter()
+    for i in range(N_UPLOADS):
+        bot.upload(content, f"File {i}", name="file.txt")
+    return N_UPLOADS / (perf_counter() - start)
+
+
+def bench_upload_throughput():
+    # MB/s of uploading a large file from disk, read and sent in chunks
+    bot = make_bot()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "large.bin")
+        with open(path, "wb") as file:
+            file.truncate(UPLOAD_MB * 1024 * 1024)
+        start = perf_counter()
+        bot.upload(path, "Large file")
+        return UPLOAD_MB / (perf_counter() - start)
+
+
+def bench_constructor():
+    # Time in ms to construct a connected ClusterBot (loading all users)
+    fake = FakeSlack(n_users=N_USERS)
+    seconds = min(timeit.repeat(lambda: make_bot(fake), number=1, repeat=20))
+    return seconds * 1e3
+
+
+def bench_append_memory():
+    # Memory in kB retained for a message with ``N_LINES`` appended lines,
+    # including the message text kept by the fake workspace
+    bot = make_bot()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    message_id = bot.send("Log")
+    for i in range(N_LINES):
+        bot.append(message_id, f"Step {i:5d} done")
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    retained = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    return retained / 1024
+
+
+def main():
+    messages_per_s = bench_messages()
+    pbar_updates_per_s = bench_pbar_updates()
+    track_us = bench_track()
+    uploads_per_s = bench_uploads()
+    upload_mb_per_s = bench_upload_throughput()
+    constructor_ms = bench_constructor()
+    kb_per_10k_lines = bench_append_memory() * 10000 / N_LINES
+    min_messages_per_s = MIN_MESSAGES_PER_S / TOLERANCE
+    min_pbar_updates_per_s = MIN_PBAR_UPDATES_PER_S / TOLERANCE
+    max_track_us = MAX_TRACK_US_PER_ITEM * TOLERANCE
+    min_uploads_per_s = MIN_UPLOADS_PER_S / TOLERANCE
+    min_upload_mb_per_s = MIN_UPLOAD_MB_PER_S / TOLERANCE
+    max_constructor_ms = MAX_CONSTRUCTOR_MS * TOLERANCE
+    print(f"send: {messages_per_s:.0f} messages/s (target: > {min_messages_per_s:g})")
+    print(
+        f"update_pbar: {pbar_updates_per_s:.0f} calls/s "
+        f"(target: > {min_pbar_updates_per_s:g})"
+    )
+    print(
+        f"track: {track_us:.3f} us overhead per item "
+        f"(target: < {max_track_us:g} us)"
+    )
+    print(f"upload: {uploads_per_s:.0f} files/s (target: > {min_uploads_per_s:g})")
+    print(
+        f"upload of {UPLOAD_MB} MB: {upload_mb_per_s:.0f} MB/s "
+        f"(target: > {min_upload_mb_per_s:g} MB/s)"
+    )
+    print(
+        f"ClusterBot() with {N_USERS} users: {constructor_ms:.2f} ms "
+        f"(target: < {max_constructor_ms:g} ms)"
+    )
+    print(
+        f"append: {kb_per_10k_lines:.0f} kB per 10k lines "
+        f"(target: < {MAX_KB_PER_10K_LINES} kB)"
+    )
+    slow = (
+        messages_per_s < min_messages_per_s
+        or pbar_updates_per_s < min_pbar_updates_per_s
+        or track_us > max_track_us
+        or uploads_per_s < min_uploads_per_s
+        or upload_mb_per_s < min_upload_mb_per_s
+        or constructor_ms > max_constructor_ms
+        or kb_per_10k_lines > MAX_KB_PER_10K_LINES
+    )
+    return 1 if slow else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
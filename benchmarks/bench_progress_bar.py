@@ -0,0 +1,62 @@
+"""
+Micro-benchmark of rendering a progress bar.
+
+Run from the repository root with ``python -m benchmarks.bench_progress_bar``.
+Exits with status 1 if a render takes longer than the target of 10 us or an update
+(which mostly doesn't render) takes longer than 0.5 us. The targets are loosened
+by the factor in the ``BENCHMARK_TOLERANCE`` environment variable.
+"""
+
+import os
+import sys
+import timeit
+
+from clusterbot.progress_bar import ProgressBar
+
+TARGET_US = 10
+TARGET_UPDATE_US = 0.5
+TOLERANCE = float(os.environ.get("BENCHMARK_TOLERANCE", "1"))
+NUMBER = 100000
+N_UPDATES = 10**6
+
+
+def bench_render(width):
+    pbar = ProgressBar(10**9, title="Benchmark", width=width)
+    pbar.state = 123456
+    current_time = pbar.start_time + 100
+    seconds = min(
+        timeit.repeat(
+            lambda: pbar.build_output_string(current_time), number=NUMBER, repeat=5
+        )
+    )
+    return seconds / NUMBER * 1e6
+
+
+def bench_update():
+    # Time per ``update()`` in a loop with cheap iterations
+    pbar = ProgressBar(N_UPDATES, title="Benchmark", width=80)
+    pbar.init()
+    update = pbar.update
+    start = timeit.default_timer()
+    for _ in range(N_UPDATES):
+        update()
+    return (timeit.default_timer() - start) / N_UPDATES * 1e6
+
+
+def main():
+    target_us = TARGET_US * TOLERANCE
+    target_update_us = TARGET_UPDATE_US * TOLERANCE
+    slow = False
+    for label, width in [("fixed width (Slack)", 80), ("terminal width", None)]:
+        render_us = bench_render(width)
+        slow |= render_us > target_us
+        print(f"render, {label}: {render_us:.2f} us per render")
+    print(f"target: < {target_us:g} us per render")
+    update_us = bench_update()
+    slow |= update_us > target_update_us
+    print(f"update: {update_us:.3f} us per update (target: < {target_update_us:g} us)")
+    return 1 if slow else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
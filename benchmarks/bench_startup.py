@@ -0,0 +1,68 @@
+"""
+Benchmark of the startup time of a lazy ClusterBot.
+
+Run from the repository root with ``python -m benchmarks.bench_startup``.
+Measures ``import clusterbot; ClusterBot(lazy=True)`` in fresh interpreters. Exits
+with status 1 if it takes longer than the target of 10 ms on top of importing the
+standard library modules ClusterBot needs (``logging``, ``configparser`` and
+``threading``, which most scripts import anyway). The target is loosened by the
+factor in the ``BENCHMARK_TOLERANCE`` environment variable.
+"""
+
+import os
+import sys
+import subprocess
+
+TARGET_MS = 10
+REPEAT = 20
+TOLERANCE = float(os.environ.get("BENCHMARK_TOLERANCE", "1"))
+
+STARTUP = """
+import os
+import sys
+import time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+{imports}
+imported = time.perf_counter()
+{construct}
+constructed = time.perf_counter()
+print(imported - start, constructed - imported)
+"""
+
+
+def bench_startup(imports, construct="pass"):
+    # Return the minimal (import, construction) times in ms over fresh interpreters
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = STARTUP.format(root=root, imports=imports, construct=construct)
+    times = []
+    for _ in range(REPEAT):
+        output = subprocess.run(
+            [sys.executable, "-c", code], stdout=subprocess.PIPE, check=True
+        ).stdout
+        times.append([float(t) * 1e3 for t in output.split()])
+    return min(t[0] for t in times), min(t[1] for t in times)
+
+
+def main():
+    import_ms, construct_ms = bench_startup(
+        "import clusterbot",
+        "clusterbot.ClusterBot(user_id='U0000000', slack_token='xoxb-benchmark', "
+        "user_config_file=os.devnull, system_config_file=os.devnull, lazy=True)",
+    )
+    stdlib_ms, _ = bench_startup("import logging, configparser, threading")
+    slack_ms, _ = bench_startup("import slack")
+    total_ms = import_ms + construct_ms
+    target_ms = TARGET_MS * TOLERANCE
+    print(f"import clusterbot: {import_ms:.1f} ms")
+    print(f"  of which logging, configparser and threading: {stdlib_ms:.1f} ms")
+    print(f"ClusterBot(lazy=True): {construct_ms:.2f} ms")
+    print(f"total: {total_ms:.1f} ms")
+    print(f"total without standard library: {total_ms - stdlib_ms:.1f} ms")
+    print(f"target: < {target_ms:g} ms without standard library")
+    print(f"for comparison, import slack (deferred to first use): {slack_ms:.1f} ms")
+    return 1 if total_ms - stdlib_ms > target_ms else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,7 +3,15 @@ ClusterBot sends messages from your Python scripts to Slack.
 """
 from .version import __version__
 import logging
-from .clusterbot import ClusterBot
+from .clusterbot import ClusterBot, SendResult
+from .async_clusterbot import AsyncClusterBot
+from .background import MessageHandle
+from .pbar_scheduler import PbarHandle
+from .shared_pbar import SharedPbar
+from .track import Tracker
+from .message_store import MessageStore
+from .log_stream import LogStream
+from .log_handler import SlackHandler
 
 logging.getLogger(__name__).addHandler(logging.NullHandler())
 
@@ -26,4 +34,17 @@ def activate_logger(loglevel: str = "INFO") -> None:
     logger.setLevel(getattr(logging, loglevel))
 
 
-__all__ = ["__version__", "ClusterBot", "activate_logger"]
+__all__ = [
+    "__version__",
+    "ClusterBot",
+    "SendResult",
+    "AsyncClusterBot",
+    "MessageHandle",
+    "PbarHandle",
+    "SharedPbar",
+    "Tracker",
+    "MessageStore",
+    "LogStream",
+    "SlackHandler",
+    "activate_logger",
+]
@@ -0,0 +1,220 @@
+"""
+Definition of the AsyncClusterBot class.
+"""
+
+import logging
+from functools import partial
+from time import perf_counter
+
+from .clusterbot import ClusterBot
+
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncClusterBot(object):
+    """
+    Asyncio version of ClusterBot, whose methods are coroutines.
+
+    Slack calls are made by an asynchronous client with one connection pool and
+    don't block the event loop, such that concurrent calls (e.g. sends to different
+    users) overlap. Configuration and users are loaded by a ``ClusterBot``
+    (available as ``bot``), such that both classes resolve users identically.
+    Progress bar messages are updated by a background thread, as in ``ClusterBot``.
+
+    Use as ``async with AsyncClusterBot() as bot: ...`` or call ``close()`` when
+    done.
+
+    Parameters
+    ----------
+    args, kwargs
+        Passed to ``ClusterBot``. See its docstring for details. ``background``,
+        ``outbox`` and ``digest`` are not supported.
+    """
+
+    def __init__(self, *args, **kwargs):
+        if kwargs.get("background"):
+            raise ValueError("AsyncClusterBot doesn't support ``background=True``.")
+        if kwargs.get("outbox"):
+            raise ValueError("AsyncClusterBot doesn't support ``outbox``.")
+        if kwargs.get("digest") is not None:
+            raise ValueError("AsyncClusterBot doesn't support ``digest``.")
+        self.bot = ClusterBot(*args, **kwargs)
+        self.stored_messages = self.bot.stored_messages
+        self.transport = None
+        self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def _run(self, func, *args, **kwargs):
+        # Run blocking ``func`` in a thread, without blocking the event loop
+        # (asyncio, aiohttp and slack are imported on first use for fast startup)
+        import asyncio
+
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, partial(func, *args, **kwargs))
+
+    async def _call(self, method, **kwargs):
+        if self.bot.relay is not None or self.bot._custom_transport is not None:
+            # the relay connection and custom transports are blocking
+            return await self._run(self.bot._call, method, **kwargs)
+        if self.transport is None:
+            import aiohttp
+            import slack
+            from .transport import AsyncSlackTransport
+
+            # the session needs a running event loop
+            self._session = aiohttp.ClientSession()
+            client = slack.WebClient(
+                self.bot.slack_token, run_async=True, session=self._session
+            )
+            self.transport = AsyncSlackTransport(client, stats=self.bot._stats)
+        recipient = kwargs.get("channel")
+        start = perf_counter()
+        try:
+            response = await self.transport.call(method, **kwargs)
+        except Exception:
+            self.bot._stats.add_call(method, perf_counter() - start, recipient, True)
+            raise
+        self.bot._stats.add_call(method, perf_counter() - start, recipient)
+        return response
+
+    async def _get_channel(self, user_name=None, user_id=None):
+        # Return the IM channel ID with the given (or default) user
+        if not self.bot._connected:
+            await self._run(self.bot._connect)
+        if user_name is None and user_id is None:
+            user_name = self.bot.default_user["name"]
+            user_id = self.bot.default_user["id"]
+
+        if not user_id in self.bot.conversations:
+            user_id, user_name = await self._run(
+                self.bot._verify_user, user_id=user_id, user_name=user_name
+            )
+            if not user_id in self.bot.conversations:
+                await self._run(self.bot._open_conversation, user_id)
+
+        return self.bot.conversations[user_id], user_name, user_id
+
+    async def send(self, message, reply_to=None, user_name=None, user_id=None):
+        """
+        Send ``message`` to Slack via ClusterBot. See ``ClusterBot.send()``.
+        """
+        channel, user_name, user_id = await self._get_channel(user_name, user_id)
+        dedup = self.bot._dedup
+        if dedup is not None:
+            from .dedup import text_digest
+
+            digest = text_digest(message)
+            message_id = self.bot._find_duplicate(digest, channel, reply_to, message)
+            if message_id is not None:
+                return message_id
+        if reply_to is None:
+            response = await self._call(
+                "chat.postMessage", channel=channel, text=message
+            )
+            logger.info(f"Sent message to '{user_name}' (ID: '{user_id}'): {message}")
+        else:
+            response = await self._call(
+                "chat.postMessage", channel=channel, text=message, thread_ts=reply_to
+            )
+            logger.info(f"Sent reply to '{user_name}' (ID: '{user_id}'): {message}")
+
+        message_id = response.data["ts"]
+        self.stored_messages[message_id] = message
+        if dedup is not None:
+            dedup.add(dedup.key(digest, channel, reply_to), message_id)
+        return message_id
+
+    async def reply(self, ts, message, **kwargs):
+        """
+        Reply to message ``ts``. See ``ClusterBot.reply()``.
+        """
+        return await self.send(message, reply_to=ts, **kwargs)
+
+    async def upload(self, file_name, message, **kwargs):
+        """
+        Upload a file to Slack. See ``ClusterBot.upload()``.
+        """
+        # the file is streamed to Slack by a thread
+        return await self._run(self.bot.upload, file_name, message, **kwargs)
+
+    async def update(self, edit_id, message, user_name=None, user_id=None):
+        """
+        Replace the text of message ``edit_id``. See ``ClusterBot.update()``.
+        """
+        channel, user_name, user_id = await self._get_channel(user_name, user_id)
+        await self._call("chat.update", channel=channel, ts=edit_id, text=message)
+        logger.info(f"Updated message to '{user_name}' (ID: '{user_id}'): {message}")
+        self.stored_messages[edit_id] = message
+        if self.bot._dedup is not None:
+            self.bot._dedup.discard(edit_id)
+
+    async def append(self, edit_id, message, user_name=None, user_id=None):
+        """
+        Append a line to message ``edit_id``. See ``ClusterBot.append()``.
+        """
+        original_message = self.stored_messages.get(edit_id)
+        if original_message is None:
+            raise RuntimeError(
+                f"Can't append to message with id {edit_id}, don't have that message "
+                "stored."
+            )
+        channel, user_name, user_id = await self._get_channel(user_name, user_id)
+        text = f"{original_message}\n{message}"
+        await self._call("chat.update", channel=channel, ts=edit_id, text=text)
+        logger.info(f"Appended to message to '{user_name}' ({user_id}): {message}")
+        # stored after the update succeeded, without copying the text again
+        self.stored_messages.append(edit_id, message, text=text)
+        if self.bot._dedup is not None:
+            self.bot._dedup.discard(edit_id)
+
+    async def delete(self, delete_id, user_name=None, user_id=None):
+        """
+        Delete message ``delete_id``. See ``ClusterBot.delete()``.
+        """
+        channel, user_name, user_id = await self._get_channel(user_name, user_id)
+        await self._call("chat.delete", channel=channel, ts=delete_id)
+        logger.info(f"Deleted message to '{user_name}' (ID: '{user_id}')")
+        del self.stored_messages[delete_id]
+        if self.bot._dedup is not None:
+            self.bot._dedup.discard(delete_id)
+
+    async def init_pbar(self, max_value, **kwargs):
+        """
+        Initialize a progress bar. See ``ClusterBot.init_pbar()``.
+        """
+        return await self._run(self.bot.init_pbar, max_value, **kwargs)
+
+    async def update_pbar(self, current_value=None, pbar=None, **kwargs):
+        """
+        Update an existing progress bar. See ``ClusterBot.update_pbar()``.
+        """
+        # only schedules the update, which is sent by a background thread
+        self.bot.update_pbar(current_value, pbar=pbar, **kwargs)
+
+    def stats(self):
+        """
+        Return statistics of the Slack calls. See ``ClusterBot.stats()``.
+        """
+        return self.bot.stats()
+
+    async def flush(self):
+        """
+        Send pending progress bar states.
+        """
+        await self._run(self.bot.flush)
+
+    async def close(self):
+        """
+        Send pending progress bar states and close the connections to Slack.
+        """
+        await self.flush()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+            self.transport = None
@@ -0,0 +1,127 @@
+"""
+Background delivery of Slack calls through an in-process queue.
+"""
+
+import atexit
+import logging
+import queue
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+class MessageHandle(object):
+    """
+    Placeholder for the ID (``ts`` value) of a message delivered in the background.
+
+    A handle can be passed to any ``ClusterBot`` method that expects a message ID
+    (e.g. as ``reply_to`` or ``edit_id``). It is resolved to the real ``ts`` once the
+    message was sent.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._ts = None
+        self._error = None
+
+    def _set_result(self, ts):
+        self._ts = ts
+        self._event.set()
+
+    def _set_error(self, error):
+        self._error = error
+        self._event.set()
+
+    def done(self):
+        """
+        Return True if the call was delivered (successfully or not).
+        """
+        return self._event.is_set()
+
+    def result(self, timeout=None):
+        """
+        Wait for the call to be delivered and return its result.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Maximal time in seconds to wait. If None, wait until delivered.
+
+        Returns
+        -------
+        ts : str
+            ID of the sent message.
+        """
+        if not self._event.wait(timeout):
+            raise TimeoutError("Message was not delivered within the timeout.")
+        if self._error is not None:
+            raise self._error
+        if isinstance(self._ts, MessageHandle):
+            # e.g. a digest, resolved to the handle of its delivery in background mode
+            return self._ts.result(timeout)
+        return self._ts
+
+    @property
+    def ts(self):
+        return self.result()
+
+    def __str__(self):
+        return str(self.result())
+
+    def __repr__(self):
+        if not self.done():
+            state = "pending"
+        elif self._error is not None:
+            state = f"failed: {self._error!r}"
+        else:
+            state = f"ts={self._ts!r}"
+        return f"<MessageHandle {state}>"
+
+
+def resolve_ts(ts):
+    """
+    Return the message ID for ``ts``, waiting for it if it is a ``MessageHandle``.
+    """
+    if isinstance(ts, MessageHandle):
+        return ts.result()
+    return ts
+
+
+class BackgroundWorker(object):
+    """
+    Worker thread that executes queued calls in submission order.
+    """
+
+    def __init__(self, name="clusterbot-worker"):
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+        # Deliver everything that is still queued when the interpreter exits
+        atexit.register(self.flush)
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queue ``func(*args, **kwargs)`` and return a ``MessageHandle`` for its result.
+        """
+        handle = MessageHandle()
+        self._queue.put((func, args, kwargs, handle))
+        return handle
+
+    def flush(self):
+        """
+        Block until all queued calls are delivered.
+        """
+        if self._thread.is_alive():
+            self._queue.join()
+
+    def _run(self):
+        while True:
+            func, args, kwargs, handle = self._queue.get()
+            try:
+                handle._set_result(func(*args, **kwargs))
+            except Exception as error:
+                logger.error(f"Background delivery of Slack call failed: {error}")
+                handle._set_error(error)
+            finally:
+                self._queue.task_done()
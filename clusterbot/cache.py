@@ -0,0 +1,160 @@
+"""
+Persistent file cache of Slack users and IM channels, shared between processes.
+"""
+
+import os
+import json
+import hashlib
+import logging
+import tempfile
+from time import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows, cache works without file locks
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 3
+
+
+def default_cache_dir():
+    """
+    Return the default cache directory (``$XDG_CACHE_HOME/slack-clusterbot``).
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME", os.path.join("~", ".cache"))
+    return os.path.join(cache_home, "slack-clusterbot")
+
+
+def token_hash(slack_token):
+    """
+    Return a short hash identifying ``slack_token`` in file names.
+    """
+    return hashlib.sha256(slack_token.encode()).hexdigest()[:16]
+
+
+class UserCache(object):
+    """
+    File cache of the user directory and opened IM channels of one Slack token.
+
+    The cache is stored as JSON file, one per Slack token (identified by a hash of
+    the token, the token itself is not stored). Writes are atomic (write to a
+    temporary file and rename) and serialized between processes with a file lock.
+
+    Parameters
+    ----------
+    slack_token : str
+        The Slack token the cached data belongs to.
+    cache_dir : str, optional
+        Directory to store the cache in. If None, ``default_cache_dir()`` is used.
+    ttl : float, optional
+        Time in seconds after which the cache is considered outdated.
+    """
+
+    def __init__(self, slack_token, cache_dir=None, ttl=24 * 60 * 60):
+        if cache_dir is None:
+            cache_dir = default_cache_dir()
+        self.cache_dir = os.path.expanduser(cache_dir)
+        key = token_hash(slack_token)
+        self.path = os.path.join(self.cache_dir, f"{key}.json")
+        self.lock_path = os.path.join(self.cache_dir, f"{key}.lock")
+        self.ttl = ttl
+        self.data = self._load()
+
+    def get(self, key):
+        """
+        Return cached entry ``key`` or None if it is not cached.
+        """
+        return self.data.get(key)
+
+    def update(self, **entries):
+        """
+        Update cache entries and write them to disk.
+
+        Dictionary entries are merged with entries written by other processes in the
+        meantime, other entries are replaced.
+        """
+        try:
+            with self._lock(exclusive=True):
+                data = self._read()
+                for key, value in entries.items():
+                    if isinstance(value, dict) and isinstance(data.get(key), dict):
+                        data[key].update(value)
+                    else:
+                        data[key] = value
+                self._write(data)
+        except OSError as error:
+            logger.debug(f"Could not write user cache {self.path}: {error}")
+            return
+        self.data = data
+
+    def invalidate(self, *keys):
+        """
+        Remove entries ``keys`` from the cache (all entries if no keys are given).
+        """
+        try:
+            with self._lock(exclusive=True):
+                data = self._read()
+                if keys:
+                    for key in keys:
+                        data.pop(key, None)
+                else:
+                    data = self._new()
+                self._write(data)
+        except OSError as error:
+            logger.debug(f"Could not invalidate user cache {self.path}: {error}")
+            return
+        self.data = data
+
+    def _new(self):
+        return {"version": CACHE_VERSION, "created": time()}
+
+    def _load(self):
+        try:
+            with self._lock(exclusive=False):
+                return self._read()
+        except OSError as error:
+            logger.debug(f"Could not read user cache {self.path}: {error}")
+            return self._new()
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return self._new()
+        except ValueError:
+            logger.debug(f"Ignoring corrupted user cache {self.path}.")
+            return self._new()
+        if data.get("version") != CACHE_VERSION:
+            return self._new()
+        if time() - data.get("created", 0) > self.ttl:
+            logger.debug(f"User cache {self.path} expired.")
+            return self._new()
+        return data
+
+    def _write(self, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    @contextmanager
+    def _lock(self, exclusive):
+        os.makedirs(self.cache_dir, mode=0o700, exist_ok=True)
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
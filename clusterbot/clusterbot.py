@@ -3,15 +3,48 @@ Definition of the ClusterBot class.
 """
 
 import os
+import re
+import sys
 import logging
+import threading
+import atexit
 import configparser
+import itertools
 import urllib
-import slack
-from .progress_bar import ProgressBar
+from time import sleep, perf_counter
+from functools import partial
+from collections import namedtuple, OrderedDict
+from .progress_bar import ProgressBar, SLACK_WIDTH
+from .background import BackgroundWorker, MessageHandle, resolve_ts
+from .coalescer import UpdateCoalescer
+from .digest import DigestBuffer, DIGEST_WINDOW
+from .users import UserDirectory, member_record
+from .pbar_scheduler import PbarScheduler
+from .shared_pbar import SharedPbar
+from .track import Tracker
+from .message_store import MessageStore
+from .log_stream import LogStream
+from .stats import SlackStats
 
 
 logger = logging.getLogger(__name__)
 
+# Slack user IDs, e.g. ``U012AB3CD`` (``W`` for Enterprise Grid users). Kept as a
+# string, which ``re.match()`` compiles (and caches) on first use instead of at
+# import.
+USER_ID_PATTERN = r"^[UW][A-Z0-9]{6,}$"
+
+# Maximal number of checks whether Slack shared an uploaded file
+FILE_SHARE_RETRIES = 6
+# Maximal number of files Slack attaches to one message
+MAX_FILES_PER_MESSAGE = 10
+
+SendResult = namedtuple("SendResult", ["ts", "error"])
+SendResult.__doc__ = """
+Result of one message sent by ``ClusterBot.send_many()``: the message ID ``ts`` if
+it was sent, otherwise the ``error`` that prevented sending it.
+"""
+
 
 class ClusterBot(object):
     """
@@ -25,6 +58,19 @@ class ClusterBot(object):
         slack_token=None,
         user_config_file=None,
         system_config_file=None,
+        background=False,
+        pbar_interval=1.0,
+        use_cache=True,
+        relay=None,
+        message_store=None,
+        lazy=False,
+        prefetch=False,
+        dedup=False,
+        outbox=None,
+        transport=None,
+        stats_file=None,
+        dump_stats=False,
+        digest=None,
     ):
         """
         Parameters
@@ -46,9 +92,97 @@ class ClusterBot(object):
         system_config_file : str, optional
             Location of the system config file. If None, location loaded from user
             config file or default location (``/etc/slack-clusterbot``) is used.
+        background : bool, optional
+            If True, ``send``, ``reply``, ``upload``, ``update``, ``append`` and
+            ``delete`` only queue their Slack calls, which are delivered by a worker
+            thread. Message IDs are then returned as ``MessageHandle`` objects that
+            resolve to the real ``ts`` value once the message was sent. Call
+            ``flush()`` to wait for delivery (this also happens at exit).
+        pbar_interval : float, optional
+            Minimal time in seconds between two Slack updates of the same progress
+            bar. Progress bar states in between are coalesced and only the latest one
+            is sent.
+        use_cache : bool, optional
+            If True, the Slack user directory and opened conversations are cached on
+            disk (by default under ``~/.cache/slack-clusterbot``) and shared between
+            processes, such that a ClusterBot with a warm cache does not need to
+            connect to Slack during initialization. The cache directory and its
+            lifetime can be set with the ``cache_dir`` and ``cache_ttl`` (in seconds)
+            options under the ``[BOT]`` section of the config files. The cache is
+            not used with a custom ``transport``.
+        relay : str, optional
+            Address of a ClusterBot relay (``unix:///path/to/socket`` or
+            ``tcp://host:port``, see ``clusterbot.relay``) to send all Slack calls
+            through instead of connecting to Slack directly. The relay uses its own
+            Slack token. If None, the ``relay`` option under the ``[BOT]`` section of
+            the config files is used (if given). The key to authenticate with is read
+            from the ``relay_key`` option.
+        message_store : MessageStore, optional
+            Store of the texts of sent messages, used by ``append()``. If None, a
+            ``MessageStore`` keeping the 1000 most recently used messages in memory
+            is used. Pass e.g. ``MessageStore(spill_file=...)`` to keep evicted
+            messages in a SQLite file instead of dropping them.
+        lazy : bool, optional
+            If True, only the config files are read during initialization. Connecting
+            to Slack and verifying the user happen on first use, such that scripts
+            that only send messages in some runs (e.g. on failure) start quickly.
+            Errors in the Slack token or user are then raised on first use.
+        prefetch : bool, optional
+            If True (and ``lazy`` is True), connect to Slack and verify the user in
+            a background thread right away, such that the first message doesn't have
+            to wait for it.
+        dedup : bool, str or DedupIndex, optional
+            If True, messages and files that were already sent to the same user and
+            thread (e.g. by an earlier run of a restarted job) are not sent again,
+            instead the ID of the earlier message is returned. Sent contents are
+            recorded by their hash in a SQLite file in the cache directory (or in the
+            file given as ``str``, or in the given ``clusterbot.dedup.DedupIndex``).
+        outbox : bool or str, optional
+            If True, Slack calls are recorded in a SQLite journal (one per Slack
+            token in the cache directory, or the file given as ``str``) and
+            delivered by a worker thread, as in ``background`` mode. While Slack
+            can't be reached, delivery is retried and the script continues. Calls
+            that weren't delivered at exit (or when the job was killed) are
+            delivered by the next ClusterBot with the same Slack token using the
+            same journal, e.g. when the job is restarted, to the same default
+            user.
+            Messages that were on their way to Slack are not sent twice if the Slack
+            app has the ``im:history`` scope (see ``clusterbot.outbox``). Implies
+            ``lazy``. Files are recorded by their absolute path, other
+            uploads (file objects, figures) by their content. The texts of sent
+            messages are stored in the journal too, unless ``message_store`` is
+            given, such that appending works across restarts.
+        transport : object, optional
+            Transport that makes the Slack API calls instead of a ``SlackTransport``
+            connected to Slack, i.e. an object with a ``call(method, **kwargs)``
+            method that returns the response data (e.g. an in-process Slack
+            backend for tests and benchmarks, see ``clusterbot.fake_slack``). If it
+            has a ``post_upload(upload_url, source)`` method, file contents are
+            passed to it instead of being sent to the upload URL.
+        stats_file : str, optional
+            File to write the statistics of Slack calls (see ``stats()``) to at exit,
+            in the Prometheus text format (e.g. for the textfile collector of the
+            Prometheus node exporter).
+        dump_stats : bool, optional
+            If True, print a table of the statistics of Slack calls to stderr at
+            exit.
+        digest : float, optional
+            If given, messages sent with ``send()`` and ``reply()`` are collected for
+            ``digest`` seconds and then sent as one digest message per user and
+            thread, listing repeated messages once with their count (see
+            ``send()``). Progress bars, log streams and the logging handler are not
+            affected.
         """
         self.default_user = {"id": user_id, "name": user_name}
         self.slack_token = slack_token
+        # Time and count all Slack calls
+        self._stats = SlackStats()
+        self.stats_file = stats_file
+        self.dump_stats = dump_stats
+        if stats_file is not None or dump_stats:
+            # registered first, such that it runs after pending calls are delivered
+            atexit.register(self._report_stats)
+        self.relay = relay
 
         self.user_config_file = user_config_file
         if self.user_config_file is None:
@@ -69,21 +203,93 @@ class ClusterBot(object):
 
         self.config = configparser.ConfigParser()
         self.client = None
+        self.transport = None
+        self._custom_transport = transport
         self.conversations = {}
-        self.users_list = None
+        self.user_directory = None
+        self._users_pages = None
+        self._users_lock = threading.RLock()
+        self._users_from_cache = False
 
         self._load_configs()
-        self._connect_to_slack()
 
-        # Verify user information with Slack
-        u_id, u_name = self._verify_user(
-            user_id=self.default_user["id"], user_name=self.default_user["name"]
-        )
-        self.default_user["id"] = u_id
-        self.default_user["name"] = u_name
+        self._use_cache = use_cache
+        self._cache = None
+        self._connected = False
+        self._connect_lock = threading.RLock()
+        if outbox:
+            # connecting could fail while Slack is unreachable, outbox calls are
+            # retried instead
+            lazy = True
+        if not lazy:
+            self._connect()
+        elif prefetch:
+            threading.Thread(
+                target=self._prefetch, name="clusterbot-prefetch", daemon=True
+            ).start()
+
+        self._outbox = None
+        if outbox:
+            from .cache import default_cache_dir
+            from .outbox import Outbox
+
+            identity = self._outbox_identity()
+            path = outbox if isinstance(outbox, str) else None
+            if path is None:
+                # one journal per Slack token, as the user cache
+                name = "outbox.sqlite"
+                if identity is not None:
+                    name = f"outbox-{identity}.sqlite"
+                cache_dir = self.config.get("BOT", "cache_dir", fallback=None)
+                path = os.path.join(cache_dir or default_cache_dir(), name)
+            self._outbox = Outbox(self, path, identity=identity)
 
         # Store sent messages to allow appending to them
-        self.stored_messages = {}
+        self.stored_messages = message_store
+        if self.stored_messages is None and self._outbox is not None:
+            # calls replayed by a later process can append to messages of this one
+            self.stored_messages = MessageStore(
+                spill_file=self._outbox.path, write_through=True
+            )
+        if self.stored_messages is None:
+            self.stored_messages = MessageStore()
+
+        self._dedup = None
+        if dedup:
+            from .dedup import DedupIndex
+
+            if isinstance(dedup, DedupIndex):
+                self._dedup = dedup
+            else:
+                path = dedup if isinstance(dedup, str) else None
+                if path is None and self.config.has_option("BOT", "cache_dir"):
+                    path = os.path.join(self.config["BOT"]["cache_dir"], "dedup.sqlite")
+                self._dedup = DedupIndex(path)
+
+        self._worker = self._outbox
+        if self._outbox is not None:
+            # started once the message store and dedup index are set up, calls of
+            # earlier processes can be delivered right away
+            self._outbox.start()
+        if background and self._worker is None:
+            self._worker = BackgroundWorker()
+
+        # Created after the worker, such that digests are handed to the worker
+        # before it is flushed at exit
+        self._digest_all = digest is not None
+        self._digests = DigestBuffer(
+            partial(self._send_now, dedup=True),
+            window=DIGEST_WINDOW if digest is None else digest,
+        )
+
+        # Created after the worker, such that pending progress bar states are handed
+        # to the worker before it is flushed at exit
+        self._pbar_updates = UpdateCoalescer(self.update, interval=pbar_interval)
+        self._pbars = PbarScheduler(self._send_now, self._pbar_updates)
+        # the most recently initialized progress bar, updated by default
+        self.pbar = None
+        self.pbar_id = None
+        self._pbar_handle = None
 
     def _load_configs(self):
         # Check if system config file was changed in class init or through user
@@ -129,10 +335,16 @@ class ClusterBot(object):
             f"{self.system_config_file}"
         )
 
-        # load Slack token
+        # load relay address
+        if self.relay is None and self.config.has_option("BOT", "relay"):
+            self.relay = self.config["BOT"]["relay"]
+        if self.relay is not None:
+            logger.debug(f"Sending Slack calls through relay at {self.relay}.")
+
+        # load Slack token (not needed when using a relay or custom transport)
         if self.slack_token is not None:
             logger.debug("Slack token given in class instantiation.")
-        else:
+        elif self.relay is None and self._custom_transport is None:
             if self.config.has_option("BOT", "token"):
                 self.slack_token = self.config["BOT"]["token"]
             else:
@@ -173,9 +385,126 @@ class ClusterBot(object):
                     f"``id`` or ``name`` option under the ``[USER]`` section"
                 )
 
+    def _connect(self):
+        # Connect to Slack and verify the default user (on first use in lazy mode)
+        with self._connect_lock:
+            if self._connected:
+                return
+
+            # the cache is kept per Slack token, the users of a custom transport
+            # (e.g. a fake workspace) must not end up in the cache of the token
+            if (
+                self._use_cache
+                and self.slack_token is not None
+                and self.relay is None
+                and self._custom_transport is None
+            ):
+                from .cache import UserCache
+
+                ttl = self.config.getfloat("BOT", "cache_ttl", fallback=24 * 60 * 60)
+                self._cache = UserCache(
+                    self.slack_token,
+                    cache_dir=self.config.get("BOT", "cache_dir", fallback=None),
+                    ttl=ttl,
+                )
+
+            self._connect_to_slack()
+
+            # Verify user information with Slack
+            u_id, u_name = self._verify_user(
+                user_id=self.default_user["id"], user_name=self.default_user["name"]
+            )
+            self.default_user["id"] = u_id
+            self.default_user["name"] = u_name
+            self._connected = True
+
+    def _prefetch(self):
+        try:
+            self._connect()
+        except Exception as error:
+            # raised again on first use
+            logger.debug(f"Failed to connect to Slack in the background: {error}")
+
     def _connect_to_slack(self):
+        # Modules are imported on first connection, which keeps ``import clusterbot``
+        # fast (importing slack alone takes several 100 ms)
+        if self._custom_transport is not None:
+            self.transport = self._custom_transport
+            self._call("auth.test")
+            return
+
+        if self.relay is not None:
+            from .relay import RelayTransport
+
+            # the relay authenticates with Slack
+            key = self.config.get("BOT", "relay_key", fallback=None)
+            self.transport = RelayTransport(self.relay, key=key)
+            return
+
+        import slack
+        from .transport import SlackTransport
+
         self.client = slack.WebClient(self.slack_token)
-        self.client.auth_test()
+        self.transport = SlackTransport(self.client, stats=self._stats)
+        if self._cache is not None and self._cache.get("authenticated"):
+            logger.debug("Slack token was already verified, skipping authentication.")
+            return
+        self._call("auth.test")
+        if self._cache is not None:
+            self._cache.update(authenticated=True)
+
+    def _call(self, method, **kwargs):
+        # Make a Slack call through the transport, timed per method and recipient
+        recipient = (
+            kwargs.get("channel") or kwargs.get("channel_id") or kwargs.get("users")
+        )
+        start = perf_counter()
+        try:
+            response = self.transport.call(method, **kwargs)
+        except Exception:
+            self._stats.add_call(method, perf_counter() - start, recipient, error=True)
+            raise
+        self._stats.add_call(method, perf_counter() - start, recipient)
+        return response
+
+    def _load_users_list(self, use_cache=True):
+        # start loading the users list, from the cache if possible
+        if use_cache and self._cache is not None:
+            cached_records = self._cache.get("users")
+            if cached_records is not None:
+                logger.debug(f"Loaded users list from cache {self._cache.path}.")
+                self.user_directory = UserDirectory(
+                    cached_records, complete=self._cache.get("users_complete")
+                )
+                self._users_from_cache = True
+                return
+
+        # members are loaded page by page in ``_verify_user`` until the user is found
+        self.user_directory = UserDirectory()
+        self._users_pages = self._iter_users_pages()
+        self._users_from_cache = False
+        # (number of members, complete) of the directory when it was last cached
+        self._users_stored = None
+
+    def _iter_users_pages(self, limit=200):
+        cursor = None
+        while True:
+            if cursor is None:
+                response = self._call("users.list", limit=limit)
+            else:
+                response = self._call("users.list", limit=limit, cursor=cursor)
+            cursor = response.get("response_metadata", {}).get("next_cursor")
+            # only keep the compact member records, not the full response
+            yield [member_record(member) for member in response["members"]], not cursor
+            if not cursor:
+                return
+
+    def _load_users_page(self):
+        records, last_page = next(self._users_pages)
+        for record in records:
+            self.user_directory.add(*record)
+        self.user_directory.complete = last_page
+        logger.debug(f"Loaded {len(self.user_directory.by_id)} members from Slack.")
 
     def _verify_user(self, user_id=None, user_name=None):
         """
@@ -185,75 +514,193 @@ class ClusterBot(object):
         if user_id is None and user_name is None:
             raise ValueError("Need ``user_id`` or ``user_name``. Both are None.")
 
-        if self.client is None:
+        if self.transport is None:
             raise RuntimeError(
-                "Missing the webclient. Call _connect_to_slack() " "first."
+                "Missing the Slack connection. Call _connect_to_slack() " "first."
             )
 
-        if self.users_list is None:
-            # get list of users in Slack team
-            self.users_list = self.client.users_list()
-
-        # if user_id is given, check if it is in the Slack workspace
-        user_exists = False
-        if user_id is not None:
-            for member in self.users_list["members"]:
-                if user_id == member["id"]:
-                    # user_object = member
-                    user_exists = True
-                    _user_name = member["profile"]["real_name"]
-                    if user_name is not None and user_name != _user_name:
-                        logger.warning(
-                            f"The user name associated with the given user ID "
-                            f"('{_user_name}') is different from the explicitly passed "
-                            f"user name ('{user_name}'). Sending message to the former."
+        # the users list is loaded by one thread at a time, e.g. the digest thread
+        # and a caller sending to other users
+        with self._users_lock:
+            if self.user_directory is None:
+                self._load_users_list()
+
+            # IDs and emails are unique, such that loading the users list can stop
+            # once they are found. Names can only be resolved once all members are
+            # loaded, since multiple members can have the same name.
+            unique_key = user_id is not None or "@" in user_name[1:]
+            while True:
+                if self.user_directory.complete or unique_key:
+                    try:
+                        user = self.user_directory.find(
+                            user_id=user_id, user_name=user_name
                         )
-                    user_name = _user_name
-
-            if not user_exists:
-                raise AttributeError(
-                    f"Couldn't find user with ID ``{user_id}`` " "in Slack team."
-                )
-
-        # if no user_id is given but a user_name, find ID from user_names in workspace
-        else:
-            # multiple users can have the same name (TODO: is real_name not unique?)
-            matching_users = 0
-            for member in self.users_list["members"]:
-                membername = member["profile"]["real_name"]
-                if user_name == membername:
-                    user_id = member["id"]
-                    matching_users += 1
-
-            if matching_users == 0:
-                raise AttributeError(
-                    f"Couldn't find user with full name '{user_name}' in Slack team."
-                )
-            elif matching_users > 1:
-                raise AttributeError(
-                    f"Found multiple users with full name '{user_name}' in Slack team. "
-                    f"Please provide a user ID in one of the configuration files. You "
-                    f"can find your ID in your Slack profile settings."
-                )
-
-        return user_id, user_name
+                    except AttributeError:
+                        complete = self.user_directory.complete
+                        if complete and not self._users_from_cache:
+                            raise
+                    else:
+                        if not self._users_from_cache:
+                            self._store_users_in_cache()
+                        return user
+
+                if self._users_from_cache:
+                    # the cached users list is incomplete or outdated, reload from
+                    # Slack
+                    logger.debug(
+                        "Cached users list is insufficient, reloading from Slack."
+                    )
+                    self._load_users_list(use_cache=False)
+                else:
+                    self._load_users_page()
+
+    def _store_users_in_cache(self):
+        if self._cache is None:
+            return
+        complete = self.user_directory.complete
+        state = (len(self.user_directory.by_id), complete)
+        if self._users_stored == state:
+            # nothing loaded since the last call
+            return
+        self._users_stored = state
+        records = self.user_directory.records()
+        cached_records = self._cache.get("users")
+        if cached_records is not None and not complete:
+            # merge by ID with the cached members (e.g. of another process, or cached
+            # before a lookup missed and the pages up to the member were reloaded),
+            # the loaded records are newer
+            merged = OrderedDict((record[0], record) for record in cached_records)
+            merged.update((record[0], record) for record in records)
+            records = list(merged.values())
+            complete = bool(self._cache.get("users_complete"))
+        self._cache.update(users=records, users_complete=complete)
 
     def _open_conversation(self, user_id):
-        if self.client is None:
+        if self.transport is None:
             raise RuntimeError(
-                "Missing the webclient. Call _connect_to_slack() " "first."
+                "Missing the Slack connection. Call _connect_to_slack() " "first."
             )
 
+        if self._cache is not None:
+            cached_conversations = self._cache.get("conversations") or {}
+            if user_id in cached_conversations:
+                self.conversations[user_id] = cached_conversations[user_id]
+                return
+
         try:
-            self.conversations[user_id] = self.client.conversations_open(users=user_id)
+            response = self._call("conversations.open", users=user_id)
+            self.conversations[user_id] = response["channel"]["id"]
+            if self._cache is not None:
+                self._cache.update(conversations={user_id: self.conversations[user_id]})
         except urllib.error.URLError as error:
             logger.error(
                 f"Failed to open a conversation with the Slack client. Message was not "
                 f"sent. Error was: {error}"
             )
+            raise
+
+    def _outbox_identity(self):
+        # Identifies the Slack token calls recorded in the outbox are made with, only
+        # bots with the same token deliver the calls of others. None for custom
+        # transports, whose calls are only delivered by the process itself
+        from .cache import token_hash
+
+        if self._custom_transport is not None:
+            return None
+        if self.relay is not None:
+            return token_hash(f"relay:{self.relay}")
+        return token_hash(self.slack_token)
+
+    def _get_default_user(self):
+        # Return the default user, of the process that recorded the outbox call being
+        # delivered (if any)
+        call = None if self._outbox is None else self._outbox.current_call()
+        if call is not None and call.default_user is not None:
+            return call.default_user
+        return self.default_user
+
+    def _get_channel(self, user_name=None, user_id=None):
+        # Return the IM channel ID with the given (or default) user
+        self._connect()
+        if user_name is None and user_id is None:
+            # use default user, ID already check in __init__
+            default_user = self._get_default_user()
+            user_name = default_user["name"]
+            user_id = default_user["id"]
 
+        if not user_id in self.conversations:
+            # get user ID (and check it is valid)
+            user_id, user_name = self._verify_user(user_name=user_name, user_id=user_id)
+            self._open_conversation(user_id)
+
+        return self.conversations[user_id], user_name, user_id
+
+    def _dispatch(self, func, *args, **kwargs):
+        # Send collected digests referenced by the call right away, instead of
+        # waiting for their window to end when resolving their message IDs
+        for arg in itertools.chain(args, kwargs.values()):
+            if isinstance(arg, MessageHandle) and not arg.done():
+                self._digests.flush(arg)
+        # In background mode, queue the call for the worker thread
+        if self._worker is not None:
+            return self._worker.submit(func, *args, **kwargs)
+        return func(*args, **kwargs)
+
+    def flush(self):
+        """
+        Send pending digests and progress bar states and wait until all Slack calls
+        queued in background mode are delivered.
+        """
+        self._digests.flush()
+        self._pbar_updates.flush()
+        if self._worker is not None:
+            self._worker.flush()
+
+    def stats(self):
+        """
+        Return statistics of the Slack calls made by this ClusterBot.
+
+        All Slack calls (including those made to look up users and open
+        conversations) are counted and timed per API method and per recipient. The
+        transfer of file contents is reported as method ``upload_url``.
+
+        Returns
+        -------
+        stats : dict
+            ``"methods"`` and ``"recipients"`` map API methods and recipient user
+            IDs to their call count, total, mean, quantile (``p50_s``, ``p90_s``,
+            ``p99_s``, approximated by histogram buckets) and maximum time in
+            seconds. Methods additionally have ``errors`` and ``backoff_s``, the
+            time spent waiting for rate limits and retries. ``total_s``,
+            ``backoff_s``, ``rate_limit_wait_s`` and ``retry_wait_s`` are the totals
+            over all calls, ``elapsed_s`` is the time since ClusterBot was created
+            and ``slack_fraction`` the fraction of it spent in Slack calls.
+        """
+        return self._stats.snapshot(self._channel_users())
 
-    def send(self, message, reply_to=None, user_name=None, user_id=None):
+    def write_stats(self, path):
+        """
+        Write the statistics of Slack calls (see ``stats()``) to file ``path`` in the
+        Prometheus text format.
+        """
+        text = self._stats.prometheus(self._channel_users())
+        # replaced atomically, such that readers never see a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as file:
+            file.write(text)
+        os.replace(tmp_path, path)
+
+    def _channel_users(self):
+        # Map IM channel IDs to user IDs, to report recipients by user
+        return {channel: user_id for user_id, channel in self.conversations.items()}
+
+    def _report_stats(self):
+        if self.stats_file is not None:
+            self.write_stats(self.stats_file)
+        if self.dump_stats:
+            sys.stderr.write(self._stats.format(self._channel_users()) + "\n")
+
+    def send(self, message, reply_to=None, user_name=None, user_id=None, digest=None):
         """
         Send ``message`` to Slack via ClusterBot.
 
@@ -265,46 +712,260 @@ class ClusterBot(object):
             The ID (``ts`` value) of the message to reply to. This creates a thread (if
             not already created) and replies there.
         user_name : str, optional
-            Who to send the message to. This needs to be the full name used in your
-            Slack profile. If None and user_id is None, use the default user (loaded
-            during class initialization or from your config files).
+            Who to send the message to. This can be the full name or the display name
+            (optionally prefixed with ``@``) used in the Slack profile or the email
+            address of the Slack account. If None and user_id is None, use the default
+            user (loaded during class initialization or from your config files).
         user_id : str, optional
             Who to send the message to. This is a Slack user ID, which can be found in
             the profile settings. If both, user_id and user_name are given, the user_id
             is used. If both are None, use the default user (loaded during class
             initialization or from your config files).
+        digest : str or bool, optional
+            Group key of a digest to add the message to: messages to the same user
+            and thread with the same key are collected for the ``digest`` window
+            given to ClusterBot (60 seconds by default) and then sent as one message
+            (headed by the key and the number of messages), in which repeated
+            messages are listed once with their count. ``flush()`` sends pending
+            digests right away. If True, add the message to the digest without key.
+            If False, send it right away. If None, add it to the digest without key
+            if ClusterBot was created with ``digest``, else send it right away.
 
         Returns
         -------
-        ts : str
-            ID of sent message.
+        ts : str or MessageHandle
+            ID of sent message. In background mode, a ``MessageHandle`` that resolves
+            to the ID once the message was sent. For messages added to a digest, a
+            ``MessageHandle`` that resolves to the ID of the digest message once it
+            was sent. Passing it to other methods (e.g. as ``reply_to`` or
+            ``edit_id``) sends its digest right away.
         """
-        if user_name is None and user_id is None:
-            # use default user, ID already check in __init__
-            user_name = self.default_user["name"]
-            user_id = self.default_user["id"]
+        if digest is None:
+            digest = self._digest_all
+        if digest is not False:
+            key = None if digest is True else digest
+            return self._digests.add(message, key, reply_to, user_name, user_id)
+        return self._send_now(message, reply_to, user_name, user_id, dedup=True)
+
+    def _send_now(
+        self, message, reply_to=None, user_name=None, user_id=None, dedup=False
+    ):
+        # Send bypassing digests, e.g. for messages that are edited later. Only
+        # messages sent by the user are deduplicated (``dedup``), not progress bars,
+        # log streams and log records
+        return self._dispatch(
+            self._send, message, reply_to, user_name, user_id, dedup=dedup
+        )
 
-        if not user_id in self.conversations:
-            # get user ID (and check it is valid)
-            user_id, user_name = self._verify_user(user_name=user_name, user_id=user_id)
-            self._open_conversation(user_id)
+    def _send(self, message, reply_to=None, user_name=None, user_id=None, dedup=False):
+        channel, user_name, user_id = self._get_channel(user_name, user_id)
+        call = None if self._outbox is None else self._outbox.current_call()
+        if call is None:
+            return self._post_message(
+                channel, message, reply_to, user_name, user_id, dedup=dedup
+            )
+        if call.replay:
+            message_id = self._find_delivered(call, channel, resolve_ts(reply_to))
+            if message_id is not None:
+                self.stored_messages[message_id] = message
+                return message_id
+        return self._post_message(
+            channel, message, reply_to, user_name, user_id, key=call.key, dedup=dedup
+        )
 
-        channel = self.conversations[user_id]["channel"]["id"]
+    def _find_delivered(self, call, channel, thread_ts=None):
+        # Return the ID of the message posted by an interrupted attempt to deliver
+        # outbox ``call`` (tagged with its key, see ``_post_message()``) or None
+        from .outbox import is_transient
 
+        kwargs = {"channel": channel, "include_all_metadata": "true", "limit": 200}
+        # the clocks of Slack and this machine can differ a bit
+        kwargs["oldest"] = f"{call.created - 60:.6f}"
+        try:
+            if thread_ts is None:
+                response = self._call("conversations.history", **kwargs)
+            else:
+                response = self._call("conversations.replies", ts=thread_ts, **kwargs)
+        except Exception as error:
+            if is_transient(error):
+                raise
+            # e.g. without the ``im:history`` scope
+            logger.warning(
+                f"Couldn't check whether outbox call {call.key} was delivered before "
+                f"({error}), sending it again."
+            )
+            return None
+        for message in response.data.get("messages", []):
+            metadata = message.get("metadata") or {}
+            if metadata.get("event_payload", {}).get("key") == call.key:
+                logger.info(f"Outbox call {call.key} was delivered before.")
+                return message["ts"]
+        return None
+
+    def _post_message(
+        self, channel, message, reply_to, user_name, user_id, key=None, dedup=False
+    ):
+        reply_to = resolve_ts(reply_to)
+        dedup = dedup and self._dedup is not None
+        if dedup:
+            from .dedup import text_digest
+
+            digest = text_digest(message)
+            message_id = self._find_duplicate(digest, channel, reply_to, message)
+            if message_id is not None:
+                return message_id
+
+        kwargs = {}
+        if key is not None:
+            # tags the message, such that a replay can find it (see ``_send()``)
+            kwargs["metadata"] = {
+                "event_type": "clusterbot_outbox_call",
+                "event_payload": {"key": key},
+            }
         # TODO test if passing ts=None works as well
         if reply_to is None:
-            response = self.client.chat_postMessage(channel=channel, text=message)
+            response = self._call(
+                "chat.postMessage", channel=channel, text=message, **kwargs
+            )
             logger.info(f"Sent message to '{user_name}' (ID: '{user_id}'): {message}")
         else:
-            response = self.client.chat_postMessage(
-                channel=channel, text=message, thread_ts=reply_to
+            response = self._call(
+                "chat.postMessage",
+                channel=channel,
+                text=message,
+                thread_ts=reply_to,
+                **kwargs,
             )
             logger.info(f"Sent reply to '{user_name}' (ID: '{user_id}'): {message}")
 
         message_id = response.data["ts"]
         self.stored_messages[message_id] = message
+        if dedup:
+            self._dedup.add(self._dedup.key(digest, channel, reply_to), message_id)
         return message_id
 
+    def _find_duplicate(self, digest, channel, thread_ts, message):
+        # Return the ID of the message sent before with the same content, or None
+        message_id = self._dedup.get(self._dedup.key(digest, channel, thread_ts))
+        if message_id is not None:
+            logger.info(f"Skipped sending duplicate of message {message_id}: {message}")
+            if message_id not in self.stored_messages:
+                self.stored_messages[message_id] = message
+        return message_id
+
+    def send_many(self, messages, max_workers=8):
+        """
+        Send many messages, possibly to different users, in one call.
+
+        All recipients are resolved at once, the needed conversations are opened
+        concurrently and the messages are sent in parallel (within the Slack rate
+        limits). Messages to the same recipient are sent in the given order.
+
+        Parameters
+        ----------
+        messages : iterable of tuple
+            ``(recipient, message)`` or ``(recipient, message, reply_to)`` tuples.
+            ``recipient`` is a Slack user ID or a user name as in ``send()``. If
+            None, the message is sent to the default user.
+        max_workers : int, optional
+            Maximal number of messages sent at the same time.
+
+        Returns
+        -------
+        results : list of SendResult or MessageHandle
+            One ``SendResult`` per message, in the given order. Failing messages do
+            not prevent sending the others, their ``error`` is set instead. In
+            background mode, a ``MessageHandle`` that resolves to the list once all
+            messages were sent.
+        """
+        return self._dispatch(self._send_many, list(messages), max_workers)
+
+    def _send_many(self, messages, max_workers=8):
+        from concurrent.futures import ThreadPoolExecutor
+
+        results = [None] * len(messages)
+
+        # resolve every recipient once
+        users = {}
+        for recipient, *_ in messages:
+            if recipient not in users:
+                try:
+                    users[recipient] = self._resolve_recipient(recipient)
+                except (AttributeError, ValueError) as error:
+                    users[recipient] = error
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # open all missing conversations concurrently
+            missing = {
+                user[0]
+                for user in users.values()
+                if not isinstance(user, Exception) and user[0] not in self.conversations
+            }
+            opened = {
+                user_id: executor.submit(self._open_conversation, user_id)
+                for user_id in missing
+            }
+            for recipient, user in users.items():
+                if isinstance(user, Exception) or user[0] not in opened:
+                    continue
+                try:
+                    opened[user[0]].result()
+                except Exception as error:
+                    users[recipient] = error
+                else:
+                    if user[0] not in self.conversations:
+                        users[recipient] = RuntimeError(
+                            f"Failed to open a conversation with user ID '{user[0]}'."
+                        )
+
+            # messages per channel, sent one after the other to keep their order
+            queues = OrderedDict()
+            for i, (recipient, message, *reply_to) in enumerate(messages):
+                reply_to = reply_to[0] if reply_to else None
+                user = users[recipient]
+                if isinstance(user, Exception):
+                    results[i] = SendResult(None, user)
+                    continue
+                channel = self.conversations[user[0]]
+                queues.setdefault(channel, []).append((i, message, reply_to, user))
+
+            def send_queue(channel, queue):
+                for i, message, reply_to, (user_id, user_name) in queue:
+                    try:
+                        ts = self._post_message(
+                            channel, message, reply_to, user_name, user_id, dedup=True
+                        )
+                    except Exception as error:
+                        logger.error(
+                            f"Failed to send message to '{user_name}' (ID: "
+                            f"'{user_id}'). Error was: {error}"
+                        )
+                        results[i] = SendResult(None, error)
+                    else:
+                        results[i] = SendResult(ts, None)
+
+            for future in [
+                executor.submit(send_queue, channel, queue)
+                for channel, queue in queues.items()
+            ]:
+                future.result()
+
+        return results
+
+    def _resolve_recipient(self, recipient):
+        # Return ``(user_id, user_name)`` of a ``send_many()`` recipient
+        self._connect()
+        if recipient is None:
+            default_user = self._get_default_user()
+            user_id, user_name = default_user["id"], default_user["name"]
+        elif re.match(USER_ID_PATTERN, recipient):
+            user_id, user_name = recipient, None
+        else:
+            user_id, user_name = None, recipient
+        if user_id in self.conversations:
+            return user_id, user_name
+        return self._verify_user(user_id=user_id, user_name=user_name)
+
     def reply(self, ts, message, **kwargs):
         """
         Reply to a message on Slack via ClusterBot.
@@ -316,8 +977,9 @@ class ClusterBot(object):
         message : str
             Message to send.
         kwargs : dict, optional
-            Keyword arguments passed to ``send()``. These are ``user_name`` and
-            ``user_id`` (optional). See ``send()`` docstring for details.
+            Keyword arguments passed to ``send()``. These are ``user_name``,
+            ``user_id`` and ``digest`` (optional). See ``send()`` docstring for
+            details.
 
         Returns
         -------
@@ -327,16 +989,27 @@ class ClusterBot(object):
 
         return self.send(message, reply_to=ts, **kwargs)
 
-    def upload(self, file_name, message, reply_to=None, user_name=None, user_id=None):
+    def upload(
+        self,
+        file_name,
+        message,
+        reply_to=None,
+        user_name=None,
+        user_id=None,
+        name=None,
+    ):
         """
         Upload a file to slack.
 
+        The file is streamed to Slack in chunks, such that uploading needs little
+        memory no matter how large the file is.
+
         Parameters
         ----------
-        file_name : str
-            Path to file that will be uploaded to slack.
-        ts : str
-            The ID of the message to reply to. Returned by ``send()`` or ``reply()``.
+        file_name : str, os.PathLike, bytes, memoryview, file object or figure
+            Path to file that will be uploaded to slack. Alternatively, the file
+            content, a binary file object (e.g. ``io.BytesIO``) or a figure with a
+            ``savefig()`` method (e.g. a matplotlib figure, uploaded as PNG).
         message : str
             Message to send.
         reply_to : str, optional
@@ -345,41 +1018,237 @@ class ClusterBot(object):
         kwargs : dict, optional
             Keyword arguments passed to ``send()``. These are ``user_name`` and
             ``user_id`` (optional). See ``send()`` docstring for details.
+        name : str, optional
+            File name shown in Slack. If None, the name of the file is used
+            (``"figure.png"`` for figures and ``"file"`` for file contents).
 
         Returns
         -------
-        ts : str
-            ID of sent message.
+        ts : str or None
+            ID of sent message. None if it can't be looked up: Slack shares files
+            asynchronously and ClusterBot waits about 16 seconds for the message to
+            show up, which needs the ``files:read`` scope of the Slack app.
         """
-        if user_name is None and user_id is None:
-            # use default user, ID already check in __init__
-            user_name = self.default_user["name"]
-            user_id = self.default_user["id"]
+        if self._outbox is not None:
+            file_name, name = self._recordable_file(file_name, name)
+        return self._dispatch(
+            self._upload, file_name, message, reply_to, user_name, user_id, name
+        )
 
-        if not user_id in self.conversations:
-            # get user ID (and check it is valid)
-            user_id, user_name = self._verify_user(user_name=user_name, user_id=user_id)
-            self._open_conversation(user_id)
+    def _upload(
+        self,
+        file_name,
+        message,
+        reply_to=None,
+        user_name=None,
+        user_id=None,
+        name=None,
+    ):
+        # imported on first upload, since importing urllib.request is slow
+        from .upload import UploadSource
+
+        reply_to = resolve_ts(reply_to)
+        channel, user_name, user_id = self._get_channel(user_name, user_id)
+        with UploadSource(file_name, name) as source:
+            if self._dedup is not None:
+                digest = f"{source.name}:{source.digest()}"
+                m_id = self._find_duplicate(digest, channel, reply_to, message)
+                if m_id is not None:
+                    return m_id
+            uploaded_file = self._upload_file(source)
+        m_id = self._complete_upload([uploaded_file], channel, message, reply_to)
+        logger.info(f"Sent file to '{user_name}' (ID: '{user_id}'): {message}")
+        if self._dedup is not None and m_id is not None:
+            self._dedup.add(self._dedup.key(digest, channel, reply_to), m_id)
+        return m_id
 
-        channel = self.conversations[user_id]["channel"]["id"]
-        if reply_to is None:
-            response = self.client.files_upload(
-                channels=channel, initial_comment=message, file=file_name,
-            )
-            logger.info(f"Sent file to '{user_name}' (ID: '{user_id}'): {message}")
-        else:
-            response = self.client.files_upload(
-                channels=channel,
-                initial_comment=message,
-                file=file_name,
-                thread_ts=reply_to,
-            )
-            logger.info(f"Sent file to '{user_name}' (ID: '{user_id}'): {message}")
-        f_id = response.data["file"]["ims"][0]
-        m_id = response.data["file"]["shares"]["private"][f_id][0]["ts"]
-        self.stored_messages[m_id] = message
+    def upload_many(
+        self,
+        files,
+        message,
+        reply_to=None,
+        user_name=None,
+        user_id=None,
+        zip_below=None,
+        zip_name="files.zip",
+        max_workers=8,
+    ):
+        """
+        Upload many files to slack, attached to a single message.
+
+        The files are uploaded in parallel. Slack attaches at most 10 files to one
+        message, further files are sent as replies in its thread.
+
+        Parameters
+        ----------
+        files : iterable
+            The files to upload, each as accepted by ``upload()`` or as
+            ``(file, name)`` tuple to set the file name shown in Slack.
+        message : str
+            Message to send with the files.
+        reply_to : str, optional
+            The ID (``ts`` value) of the message to reply to with the files.
+        kwargs : dict, optional
+            Keyword arguments passed to ``send()``. These are ``user_name`` and
+            ``user_id`` (optional). See ``send()`` docstring for details.
+        zip_below : int, optional
+            If given, files smaller than ``zip_below`` bytes are packed into a single
+            zip archive named ``zip_name`` instead of being uploaded one by one.
+        zip_name : str, optional
+            File name of the zip archive of small files.
+        max_workers : int, optional
+            Maximal number of files uploaded at the same time.
+
+        Returns
+        -------
+        ts : str or None
+            ID of sent message. None if it can't be looked up (see ``upload()``).
+        """
+        files = list(files)
+        if self._outbox is not None:
+            files = [
+                self._recordable_file(*(f if isinstance(f, tuple) else (f,)))
+                for f in files
+            ]
+        return self._dispatch(
+            self._upload_many,
+            files,
+            message,
+            reply_to,
+            user_name,
+            user_id,
+            zip_below,
+            zip_name,
+            max_workers,
+        )
+
+    def _upload_many(
+        self,
+        files,
+        message,
+        reply_to=None,
+        user_name=None,
+        user_id=None,
+        zip_below=None,
+        zip_name="files.zip",
+        max_workers=8,
+    ):
+        from concurrent.futures import ThreadPoolExecutor
+        from .upload import UploadSource, zip_archive
+
+        if not files:
+            raise ValueError("Need at least one file to upload.")
+        reply_to = resolve_ts(reply_to)
+        channel, user_name, user_id = self._get_channel(user_name, user_id)
+
+        # ``(name, content)`` of the files to zip
+        small_files = []
+
+        def upload(file):
+            # pairs are lists when replayed from the outbox journal
+            file, name = file if isinstance(file, (tuple, list)) else (file, None)
+            with UploadSource(file, name) as source:
+                if zip_below is not None and source.length < zip_below:
+                    small_files.append((source.name, b"".join(source.chunks())))
+                    return None
+                return self._upload_file(source)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            uploaded_files = [f for f in executor.map(upload, files) if f is not None]
+        if len(small_files) == 1:
+            name, content = small_files[0]
+        elif small_files:
+            name, content = zip_name, zip_archive(small_files)
+        if small_files:
+            with UploadSource(content, name) as source:
+                uploaded_files.append(self._upload_file(source))
+
+        m_id = None
+        for i in range(0, len(uploaded_files), MAX_FILES_PER_MESSAGE):
+            batch = uploaded_files[i : i + MAX_FILES_PER_MESSAGE]
+            if i == 0:
+                m_id = self._complete_upload(batch, channel, message, reply_to)
+            else:
+                # further files in the thread of the message (if its ID is known)
+                self._complete_upload(batch, channel, thread_ts=reply_to or m_id)
+        logger.info(
+            f"Sent {len(uploaded_files)} files to '{user_name}' (ID: '{user_id}'): "
+            f"{message}"
+        )
         return m_id
 
+    def _recordable_file(self, file, name=None):
+        # Return ``(file, name)`` of an upload such that it can be recorded in the
+        # outbox journal: paths as absolute paths, anything else as its content
+        if isinstance(file, (str, os.PathLike)):
+            return os.path.abspath(file), name
+        if isinstance(file, (bytes, bytearray, memoryview)):
+            return file, name
+        from .upload import UploadSource
+
+        with UploadSource(file, name) as source:
+            return b"".join(source.chunks()), source.name
+
+    def _upload_file(self, source):
+        # Send the content of ``source`` to Slack, without sharing it yet
+        from .upload import post_chunks
+
+        response = self._call(
+            "files.getUploadURLExternal", filename=source.name, length=source.length
+        )
+        # e.g. an in-process Slack backend receives the content itself
+        post = getattr(self.transport, "post_upload", post_chunks)
+        start = perf_counter()
+        try:
+            post(response.data["upload_url"], source)
+        finally:
+            self._stats.add_call("upload_url", perf_counter() - start)
+        return {"id": response.data["file_id"], "title": source.name}
+
+    def _complete_upload(self, files, channel, message=None, thread_ts=None):
+        # Share uploaded ``files`` in ``channel`` and return the message ID
+        kwargs = {}
+        if message is not None:
+            kwargs["initial_comment"] = message
+        if thread_ts is not None:
+            kwargs["thread_ts"] = thread_ts
+        self._call(
+            "files.completeUploadExternal", files=files, channel_id=channel, **kwargs
+        )
+        m_id = self._file_message_ts(files[0]["id"], channel)
+        if message is not None and m_id is not None:
+            self.stored_messages[m_id] = message
+        return m_id
+
+    def _file_message_ts(self, file_id, channel):
+        # Return the ID of the message sharing file ``file_id``. Slack shares files
+        # asynchronously, such that the message might not exist right away.
+        # The file was shared either way, failing to find the message only means
+        # that there is no message ID to return.
+        for attempt in range(FILE_SHARE_RETRIES):
+            try:
+                response = self._call("files.info", file=file_id)
+            except Exception as error:
+                response = getattr(error, "response", None)
+                if response is None or response.get("error") != "missing_scope":
+                    raise
+                logger.warning(
+                    f"Uploaded file {file_id}, but can't look up the ID of its "
+                    f"message, since the Slack app lacks the files:read scope."
+                )
+                return None
+            shares = response.data["file"].get("shares", {})
+            for shared_in in shares.values():
+                if channel in shared_in:
+                    return shared_in[channel][0]["ts"]
+            sleep(0.25 * 2**attempt)
+            self._stats.add_backoff("files.info", 0.25 * 2**attempt, "retry")
+        logger.warning(
+            f"Uploaded file {file_id}, but Slack didn't show it as shared in channel "
+            f"{channel} yet, its message ID is unknown."
+        )
+        return None
+
     def update(self, edit_id: str, message: str, user_name=None, user_id=None):
         """
         Upload a file to slack.
@@ -399,20 +1268,17 @@ class ClusterBot(object):
         ts : str
             ID of sent message.
         """
-        if user_name is None and user_id is None:
-            # use default user, ID already check in __init__
-            user_name = self.default_user["name"]
-            user_id = self.default_user["id"]
-
-        if not user_id in self.conversations:
-            # get user ID (and check it is valid)
-            user_id, user_name = self._verify_user(user_name=user_name, user_id=user_id)
-            self._open_conversation(user_id)
+        return self._dispatch(self._update, edit_id, message, user_name, user_id)
 
-        channel = self.conversations[user_id]["channel"]["id"]
-        _ = self.client.chat_update(channel=channel, ts=edit_id, text=message,)
+    def _update(self, edit_id, message, user_name=None, user_id=None):
+        edit_id = resolve_ts(edit_id)
+        channel, user_name, user_id = self._get_channel(user_name, user_id)
+        _ = self._call("chat.update", channel=channel, ts=edit_id, text=message)
         logger.info(f"Updated message to '{user_name}' (ID: '{user_id}'): {message}")
         self.stored_messages[edit_id] = message
+        if self._dedup is not None:
+            # the message doesn't have the content it was sent with anymore
+            self._dedup.discard(edit_id)
 
     def append(self, edit_id, message, **kwargs):
         """
@@ -433,14 +1299,24 @@ class ClusterBot(object):
         ts : str
             ID of sent message.
         """
-        if edit_id not in self.stored_messages:
+        return self._dispatch(self._append, edit_id, message, **kwargs)
+
+    def _append(self, edit_id, message, user_name=None, user_id=None):
+        edit_id = resolve_ts(edit_id)
+        original_message = self.stored_messages.get(edit_id)
+        if original_message is None:
             raise RuntimeError(
-                "Can't append to message with id {edit_id}, don't have that message "
+                f"Can't append to message with id {edit_id}, don't have that message "
                 "stored."
             )
-        original_message = self.stored_messages[edit_id]
-        new_message = "\n".join([original_message, message])
-        self.update(edit_id, new_message, **kwargs)
+        channel, user_name, user_id = self._get_channel(user_name, user_id)
+        text = f"{original_message}\n{message}"
+        _ = self._call("chat.update", channel=channel, ts=edit_id, text=text)
+        logger.info(f"Appended to message to '{user_name}' ({user_id}): {message}")
+        # stored after the update succeeded, without copying the text again
+        self.stored_messages.append(edit_id, message, text=text)
+        if self._dedup is not None:
+            self._dedup.discard(edit_id)
 
     def delete(self, delete_id: str, user_name=None, user_id=None):
         """
@@ -459,51 +1335,203 @@ class ClusterBot(object):
         ts : str
             ID of sent message.
         """
-        if user_name is None and user_id is None:
-            # use default user, ID already check in __init__
-            user_name = self.default_user["name"]
-            user_id = self.default_user["id"]
+        return self._dispatch(self._delete, delete_id, user_name, user_id)
 
-        if not user_id in self.conversations:
-            # get user ID (and check it is valid)
-            user_id, user_name = self._verify_user(user_name=user_name, user_id=user_id)
-            self._open_conversation(user_id)
-
-        channel = self.conversations[user_id]["channel"]["id"]
-        _ = self.client.chat_delete(channel=channel, ts=delete_id,)
+    def _delete(self, delete_id, user_name=None, user_id=None):
+        delete_id = resolve_ts(delete_id)
+        channel, user_name, user_id = self._get_channel(user_name, user_id)
+        try:
+            _ = self._call("chat.delete", channel=channel, ts=delete_id)
+        except Exception as error:
+            call = None if self._outbox is None else self._outbox.current_call()
+            response = getattr(error, "response", None)
+            if not (
+                call is not None
+                and call.replay
+                and response is not None
+                and response.get("error") == "message_not_found"
+            ):
+                raise
+            # deleted by an interrupted attempt of the same outbox call
         logger.info(f"Deleted message to '{user_name}' (ID: '{user_id}')")
         del self.stored_messages[delete_id]
+        if self._dedup is not None:
+            self._dedup.discard(delete_id)
 
-    def init_pbar(self, max_value: int, title=None, width=80, ts=None, **kwargs):
+    def stream(
+        self, title=None, reply_to=None, flush_interval=2.0, max_chars=4000, **kwargs
+    ):
+        """
+        Start a live log on Slack that lines can be written to.
+
+        Written lines are sent in batches every ``flush_interval`` seconds as
+        replies in a thread. Each reply is updated until it reaches ``max_chars``
+        characters, then a new reply is started.
+
+        Parameters
+        ----------
+        title : str, optional
+            Text of the message starting the thread of the log.
+        reply_to : str, optional
+            The ID (``ts`` value) of the message whose thread the log is written to,
+            instead of starting a new thread.
+        flush_interval : float, optional
+            Time in seconds between two flushes of the written lines.
+        max_chars : int, optional
+            Maximal number of characters of each log message.
+        kwargs : dict, optional
+            Keyword arguments passed to ``send()``. These are ``user_name`` and
+            ``user_id`` (optional). See ``send()`` docstring for details.
+
+        Returns
+        -------
+        log : LogStream
+            Log to ``write()`` to. Call its ``close()`` method when done (this also
+            happens at exit).
+        """
+        return LogStream(
+            self,
+            title=title,
+            reply_to=reply_to,
+            flush_interval=flush_interval,
+            max_chars=max_chars,
+            **kwargs,
+        )
+
+    def init_pbar(
+        self, max_value: int, title=None, width=None, ts=None, group=None, **kwargs
+    ):
         """
         Initialize a progress bar.
 
+        Any number of progress bars can be used at the same time. Progress bars in
+        the same message (see ``group``) are updated together with a single Slack
+        call.
+
         Parameters
         ----------
-        max_value : int
-            Maximal value that the progress bar counter can take.
-        width : int
-            The width of the progress bar.
+        max_value : int or None
+            Maximal value that the progress bar counter can take. If None, the
+            maximal value is unknown and the count and rate are shown instead.
+        title : str, optional
+            Title shown above the progress bar.
+        width : int, optional
+            The width of the progress bar in characters. If None, a fixed width
+            suitable for Slack messages (80) is used.
+        ts : str, optional
+            The ID (``ts`` value) of the message to reply to with the progress bar.
+        group : PbarHandle, optional
+            Show the progress bar in the same message as the progress bar ``group``
+            instead of sending a new message.
         kwargs : dict, optional
             Keyword arguments passed to ``send()``. These are ``user_name`` and
             ``user_id`` (optional). See ``send()`` docstring for details.
+
+        Returns
+        -------
+        pbar : PbarHandle
+            Handle of the progress bar, to be passed to ``update_pbar()``.
         """
-        # TODO: Allow for multiple pbars running at the same time
-        self.pbar = ProgressBar(max_value, title=title, width=width)
-        message = self.pbar.init()
-        self.pbar_id = self.send(message, reply_to=ts, **kwargs)
+        if width is None:
+            width = SLACK_WIDTH
+        handle = self._pbars.add(
+            ProgressBar(max_value, title=title, width=width),
+            group=group,
+            reply_to=ts,
+            **kwargs,
+        )
+        self._pbar_handle = handle
+        self.pbar = handle.pbar
+        self.pbar_id = handle.ts
+        return handle
 
-    def update_pbar(self, current_value=None, **kwargs):
+    def update_pbar(self, current_value=None, pbar=None, **kwargs):
         """
         Update an existing progress bar.
 
         Parameters
         ----------
-        update_step : int
-            Value by which to increment the progress bar.
+        current_value : int, optional
+            Value to set the progress bar to. If None, increment it by one.
+        pbar : PbarHandle, optional
+            The progress bar to update. If None, the most recently initialized
+            progress bar is updated.
         kwargs : dict, optional
             Keyword arguments passed to ``send()``. These are ``user_name`` and
             ``user_id`` (optional). See ``send()`` docstring for details.
         """
-        message_new = self.pbar.update(current_value)
-        self.update(self.pbar_id, message_new, **kwargs)
+        if pbar is None:
+            pbar = self._pbar_handle
+        # Only the latest state is sent, at most once per ``pbar_interval``
+        self._pbars.update(pbar, current_value, **kwargs)
+
+    def track(
+        self, iterable=None, total=None, title=None, width=None, ts=None, **kwargs
+    ):
+        """
+        Show the progress of iterating over ``iterable`` in a progress bar.
+
+        Use as ``for item in bot.track(items): ...`` or as context manager, which
+        shows the final count when the block is left (e.g. by ``break``)::
+
+            with bot.track(total=n_samples, title="Sampling") as pbar:
+                while sampling:
+                    ...
+                    pbar.update()
+
+        Items are counted in batches and the Slack message is updated by a
+        background thread, such that iterating costs little more than the bare loop
+        (about 0.1 us per item).
+
+        Parameters
+        ----------
+        iterable : iterable, optional
+            The items to iterate over. If None, count with ``update()`` of the
+            returned ``Tracker``.
+        total : int, optional
+            Number of items. If None, ``len(iterable)`` is used if available,
+            otherwise the count and rate of items are shown instead of a bar.
+        title, width, ts, kwargs
+            See ``init_pbar()``. ``group`` can be given as well.
+
+        Returns
+        -------
+        tracker : Tracker
+            Iterable over the items of ``iterable``.
+        """
+        if total is None and iterable is not None:
+            try:
+                total = len(iterable)
+            except TypeError:
+                # e.g. a generator, the count and rate are shown
+                pass
+        handle = self.init_pbar(
+            total or None, title=title, width=width, ts=ts, **kwargs
+        )
+        return Tracker(handle, iterable)
+
+    def init_shared_pbar(
+        self, max_value: int, title=None, width=None, ts=None, **kwargs
+    ):
+        """
+        Initialize a progress bar that can be updated from worker processes.
+
+        The returned ``SharedPbar`` can be passed to worker processes (e.g. of a
+        ``multiprocessing.Pool`` or ``joblib``), which call its ``update()`` method.
+        Only this process renders the progress bar and updates it on Slack. Call its
+        ``close()`` method once all workers are done.
+
+        Parameters
+        ----------
+        max_value : int
+            Maximal value that the progress bar counter can take.
+        title, width, ts, kwargs
+            See ``init_pbar()``.
+
+        Returns
+        -------
+        pbar : SharedPbar
+            Picklable handle of the progress bar.
+        """
+        handle = self.init_pbar(max_value, title=title, width=width, ts=ts, **kwargs)
+        return SharedPbar(handle)
@@ -0,0 +1,106 @@
+"""
+Coalescing of frequent message updates so only the latest state is sent to Slack.
+"""
+
+import atexit
+import logging
+import threading
+from time import monotonic
+
+
+logger = logging.getLogger(__name__)
+
+
+class UpdateCoalescer(object):
+    """
+    Send at most one update per message and ``interval``, always the latest state.
+
+    Parameters
+    ----------
+    send_update : callable
+        Called as ``send_update(edit_id, message, **kwargs)`` to deliver an update.
+    interval : float
+        Minimal time in seconds between two updates of the same message.
+    """
+
+    def __init__(self, send_update, interval=1.0):
+        self.send_update = send_update
+        self.interval = interval
+        # edit_id -> (message, kwargs) of the latest not yet sent state
+        self._pending = {}
+        # edit_id -> time of the last sent update
+        self._last_sent = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        # serializes deliveries so an older state is never sent after a newer one
+        self._send_lock = threading.Lock()
+        self._thread = None
+        atexit.register(self.flush)
+
+    def submit(self, edit_id, message, **kwargs):
+        """
+        Set ``message`` as the latest state of message ``edit_id``.
+
+        Overwrites any state of the same message that was not sent yet.
+        """
+        with self._lock:
+            self._pending[edit_id] = (message, kwargs)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="clusterbot-coalescer", daemon=True
+                )
+                self._thread.start()
+            self._wakeup.notify()
+
+    def flush(self):
+        """
+        Send all pending states immediately, ignoring ``interval``.
+        """
+        with self._send_lock:
+            with self._lock:
+                batch = self._take(due_only=False)
+            self._deliver(batch)
+
+    def _take(self, due_only=True):
+        now = monotonic()
+        batch = []
+        for edit_id in list(self._pending):
+            last_sent = self._last_sent.get(edit_id)
+            if due_only and last_sent is not None and now - last_sent < self.interval:
+                continue
+            message, kwargs = self._pending.pop(edit_id)
+            self._last_sent[edit_id] = now
+            batch.append((edit_id, message, kwargs))
+        return batch
+
+    def _time_to_next_due(self):
+        # None (wait for submit) if nothing is pending
+        if not self._pending:
+            return None
+        now = monotonic()
+        wait = self.interval
+        for edit_id in self._pending:
+            last_sent = self._last_sent.get(edit_id)
+            if last_sent is None:
+                return 0
+            wait = min(wait, last_sent + self.interval - now)
+        return max(wait, 0)
+
+    def _deliver(self, batch):
+        for edit_id, message, kwargs in batch:
+            try:
+                self.send_update(edit_id, message, **kwargs)
+            except Exception as error:
+                logger.error(f"Failed to update message {edit_id}: {error}")
+
+    def _run(self):
+        while True:
+            with self._wakeup:
+                timeout = self._time_to_next_due()
+                while timeout is None or timeout > 0:
+                    self._wakeup.wait(timeout)
+                    timeout = self._time_to_next_due()
+            with self._send_lock:
+                with self._lock:
+                    batch = self._take()
+                self._deliver(batch)
@@ -0,0 +1,92 @@
+"""
+Persistent index of sent contents, used to skip sending duplicates.
+"""
+
+import os
+import hashlib
+import logging
+import sqlite3
+import threading
+from time import time
+
+from .cache import default_cache_dir
+
+
+logger = logging.getLogger(__name__)
+
+
+def text_digest(text):
+    """
+    Return the SHA-256 hex digest of message ``text``.
+    """
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class DedupIndex(object):
+    """
+    Index of the IDs of sent messages by content hash, recipient and thread.
+
+    The index is stored in a SQLite file, such that repeated runs of a script (e.g.
+    a job restarted from a checkpoint) and concurrent processes share it. Entries
+    older than ``max_age`` are dropped when the index is opened.
+
+    Parameters
+    ----------
+    path : str, optional
+        SQLite file of the index. If None, ``dedup.sqlite`` in
+        ``default_cache_dir()`` is used.
+    max_age : float, optional
+        Time in seconds after which sent contents are forgotten.
+    """
+
+    def __init__(self, path=None, max_age=30 * 24 * 60 * 60):
+        if path is None:
+            path = os.path.join(default_cache_dir(), "dedup.sqlite")
+        self.path = os.path.expanduser(path)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        # concurrent writers of other processes are waited for up to ``timeout``
+        self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sent "
+                "(key TEXT PRIMARY KEY, ts TEXT, created REAL)"
+            )
+            # ``discard()`` is called for every edited message
+            self._db.execute("CREATE INDEX IF NOT EXISTS sent_ts ON sent (ts)")
+            self._db.execute("DELETE FROM sent WHERE created < ?", (time() - max_age,))
+
+    @staticmethod
+    def key(digest, channel, thread_ts=None):
+        """
+        Return the index key of content ``digest`` sent to ``channel`` and thread.
+        """
+        return f"{channel}:{thread_ts or ''}:{digest}"
+
+    def get(self, key):
+        """
+        Return the ID of the message sent with ``key`` or None.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT ts FROM sent WHERE key = ?", (key,))
+            row = row.fetchone()
+        return None if row is None else row[0]
+
+    def add(self, key, ts):
+        """
+        Record that message ``ts`` was sent with ``key``.
+        """
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO sent VALUES (?, ?, ?)", (key, ts, time())
+            )
+
+    def discard(self, ts):
+        """
+        Forget message ``ts`` (e.g. because it was edited or deleted).
+        """
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM sent WHERE ts = ?", (ts,))
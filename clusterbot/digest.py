@@ -0,0 +1,185 @@
+"""
+Folding of many small messages into one digest message.
+"""
+
+import atexit
+import logging
+import threading
+from time import monotonic
+from collections import OrderedDict
+
+from .background import MessageHandle
+
+
+logger = logging.getLogger(__name__)
+
+# Default time in seconds messages are collected before their digest is sent
+DIGEST_WINDOW = 60.0
+# Slack truncates messages longer than 40000 characters, longer digests are
+# continued in the thread of the digest message
+MAX_DIGEST_CHARS = 39000
+
+
+class _Digest(object):
+    # Messages to the same recipient and thread with the same group key
+    def __init__(self, group, due):
+        self.group = group
+        self.key = group[0]
+        self.due = due
+        self.n_messages = 0
+        # message -> number of times it was sent, in order of first sending
+        self.counts = OrderedDict()
+        self.handles = []
+
+    def add(self, message, handle):
+        self.n_messages += 1
+        self.counts[message] = self.counts.get(message, 0) + 1
+        self.handles.append(handle)
+
+    def render(self):
+        # Return the digest as list of texts of at most ``MAX_DIGEST_CHARS``
+        if self.n_messages == 1:
+            return [next(iter(self.counts))]
+        header = f"{self.n_messages} messages"
+        if self.key is not None:
+            header = f"*{self.key}*: {header}"
+        texts = []
+        lines = [header]
+        length = len(header)
+        for message, count in self.counts.items():
+            line = message if count == 1 else f"{message} (×{count})"
+            if length + len(line) + 1 > MAX_DIGEST_CHARS and len(lines) > 1:
+                texts.append("\n".join(lines))
+                lines = [f"{header} (continued)"]
+                length = len(lines[0])
+            lines.append(line)
+            length += len(line) + 1
+        texts.append("\n".join(lines))
+        return texts
+
+
+class DigestBuffer(object):
+    """
+    Collects messages and sends the messages of each group as one digest message.
+
+    Messages to the same recipient and thread with the same group key are collected
+    for ``window`` seconds (from the first message) and then sent as one message,
+    one line per message in the order they were sent. Identical messages are listed
+    once with their count.
+
+    Parameters
+    ----------
+    post : callable
+        Called as ``post(text, reply_to, user_name, user_id)`` to send a digest and
+        returns its ID (or a ``MessageHandle`` of it).
+    window : float
+        Time in seconds messages are collected before their digest is sent.
+
+    Notes
+    -----
+    A handle of a collected message only resolves once its digest was sent. Pass it
+    to ``flush()`` to send its digest right away instead of waiting for the rest of
+    the window, e.g. before replying to or editing the digest message.
+    """
+
+    def __init__(self, post, window=DIGEST_WINDOW):
+        self.post = post
+        self.window = window
+        # (key, reply_to, user_name, user_id) -> _Digest
+        self._digests = OrderedDict()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        # serializes sending, such that digests of one group stay in order;
+        # reentrant, since sending a reply to a digest flushes that digest first
+        self._post_lock = threading.RLock()
+        self._thread = None
+        atexit.register(self.flush)
+
+    def add(self, message, key=None, reply_to=None, user_name=None, user_id=None):
+        """
+        Add ``message`` to the digest of its group and return a ``MessageHandle``
+        that resolves to the ID of the digest message.
+        """
+        handle = MessageHandle()
+        group = (key, reply_to, user_name, user_id)
+        with self._lock:
+            digest = self._digests.get(group)
+            if digest is None:
+                digest = _Digest(group, monotonic() + self.window)
+                self._digests[group] = digest
+            digest.add(message, handle)
+            handle._digest = digest
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="clusterbot-digest", daemon=True
+                )
+                self._thread.start()
+            self._wakeup.notify()
+        return handle
+
+    def flush(self, handle=None):
+        """
+        Send all digests right away.
+
+        Parameters
+        ----------
+        handle : MessageHandle, optional
+            If given, only send the digest of this handle (if it is still
+            collected).
+        """
+        with self._post_lock:
+            with self._lock:
+                if handle is None:
+                    batch = self._take(due_only=False)
+                else:
+                    batch = self._take_digest(getattr(handle, "_digest", None))
+            self._send(batch)
+
+    def _take(self, due_only=True):
+        now = monotonic()
+        batch = []
+        for group in list(self._digests):
+            if due_only and self._digests[group].due > now:
+                continue
+            batch.append((group, self._digests.pop(group)))
+        return batch
+
+    def _take_digest(self, digest):
+        if digest is None or self._digests.get(digest.group) is not digest:
+            return []
+        return [(digest.group, self._digests.pop(digest.group))]
+
+    def _send(self, batch):
+        for (_, reply_to, user_name, user_id), digest in batch:
+            try:
+                texts = digest.render()
+                ts = self.post(texts[0], reply_to, user_name, user_id)
+                for text in texts[1:]:
+                    self.post(text, reply_to or ts, user_name, user_id)
+            except Exception as error:
+                logger.error(
+                    f"Failed to send digest of {digest.n_messages} messages: {error}"
+                )
+                for handle in digest.handles:
+                    handle._set_error(error)
+                continue
+            logger.debug(f"Sent {digest.n_messages} messages as one digest.")
+            for handle in digest.handles:
+                handle._set_result(ts)
+
+    def _run(self):
+        while True:
+            with self._wakeup:
+                while True:
+                    if self._digests:
+                        due = min(digest.due for digest in self._digests.values())
+                        timeout = due - monotonic()
+                        if timeout <= 0:
+                            break
+                    else:
+                        timeout = None
+                    self._wakeup.wait(timeout)
+            with self._post_lock:
+                with self._lock:
+                    batch = self._take()
+                self._send(batch)
@@ -0,0 +1,338 @@
+"""
+In-process imitation of the Slack API, for testing and benchmarking ClusterBot
+without a Slack workspace.
+"""
+
+import json
+import math
+import logging
+import threading
+from collections import Counter, OrderedDict
+from time import time, monotonic, sleep
+
+from .transport import RATE_LIMITS, DEFAULT_RATE_LIMIT, PER_CHANNEL_METHODS
+
+
+logger = logging.getLogger(__name__)
+
+# Upload URLs returned by ``files.getUploadURLExternal``, followed by the file ID
+UPLOAD_URL = "https://files.slack.invalid/upload/"
+
+
+class FakeResponse(dict):
+    """
+    Response of a ``FakeSlack`` call, with the attributes of a Slack response.
+    """
+
+    def __init__(self, data, status_code=200, headers=None):
+        super().__init__(data)
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    @property
+    def data(self):
+        return self
+
+
+class FakeSlackError(Exception):
+    """
+    Error of a ``FakeSlack`` call, like ``slack.errors.SlackApiError``.
+
+    The ``response`` attribute holds the ``FakeResponse``.
+    """
+
+    def __init__(self, message, response):
+        self.response = response
+        super().__init__(message)
+
+
+class FakeSlack(object):
+    """
+    In-process Slack backend that imitates the API methods used by ClusterBot.
+
+    Implements ``auth.test``, ``users.list``, ``conversations.open``,
+    ``conversations.history``, ``conversations.replies``, ``chat.postMessage``,
+    ``chat.update``, ``chat.delete`` and the external upload of files
+    (``files.getUploadURLExternal``, the upload URL (see ``post_upload()``),
+    ``files.completeUploadExternal`` and ``files.info``). Sent messages are kept
+    in ``messages``, uploaded files in ``files`` and the number of calls per
+    method in ``calls``, such that tests can check what was sent.
+
+    ``FakeSlack`` can be passed as ``transport`` to ``ClusterBot`` to measure the
+    overhead of ClusterBot itself, or wrapped in a ``SlackTransport`` (in place of a
+    ``slack.WebClient``) to include rate limiting and retries. ClusterBot doesn't
+    use its user cache with a custom transport, such that the fake users don't end
+    up in the cache of the Slack token.
+
+    Parameters
+    ----------
+    n_users : int, optional
+        Number of users in the workspace. User ``i`` has the ID ``f"U{i:07d}"``,
+        the name ``f"User {i}"`` and the display name ``f"user{i}"``.
+    latency : float, optional
+        Time in seconds each call takes.
+    rate_limits : bool or dict, optional
+        If True, calls exceeding Slack's rate limits (see
+        ``clusterbot.transport.RATE_LIMITS``) fail with status 429 and a
+        ``Retry-After`` header, as Slack does. A dict maps API methods to their
+        limits as ``(requests per minute, burst size)``, other methods aren't
+        limited. If None, calls are never rate limited.
+    share_delay : float, optional
+        Time in seconds until uploaded files show up as shared in ``files.info``
+        (Slack shares files asynchronously).
+    """
+
+    def __init__(self, n_users=100, latency=0.0, rate_limits=None, share_delay=0.0):
+        self.latency = latency
+        self.share_delay = share_delay
+        if rate_limits is True:
+            rate_limits = dict(RATE_LIMITS, default=DEFAULT_RATE_LIMIT)
+        self.rate_limits = rate_limits or {}
+        self.members = [
+            {
+                "id": f"U{i:07d}",
+                "name": f"user{i}",
+                "deleted": False,
+                "real_name": f"User {i}",
+                "profile": {
+                    "real_name": f"User {i}",
+                    "display_name": f"user{i}",
+                    "email": f"user{i}@example.org",
+                },
+            }
+            for i in range(n_users)
+        ]
+        self._user_ids = {member["id"] for member in self.members}
+        # channel -> ts -> {"text", "thread_ts"}
+        self.messages = {}
+        # file ID -> {"id", "name", "size", "uploaded", "shares"}
+        self.files = {}
+        self.calls = Counter()
+        self.rate_limited = Counter()
+        # method (or (method, channel)) -> (tokens, time of last call)
+        self._buckets = {}
+        self._last_us = 0
+        self._n_files = 0
+        self._lock = threading.Lock()
+
+    def call(self, method, **kwargs):
+        """
+        Call API ``method`` (e.g. ``"chat.postMessage"``) with ``kwargs``.
+        """
+        if self.latency:
+            sleep(self.latency)
+        handler = getattr(self, "_" + method.replace(".", "_"), None)
+        with self._lock:
+            self.calls[method] += 1
+            retry_after = self._rate_limit(method, kwargs.get("channel"))
+            if retry_after is not None:
+                self.rate_limited[method] += 1
+                response = FakeResponse(
+                    {"ok": False, "error": "ratelimited"},
+                    status_code=429,
+                    headers={"Retry-After": str(retry_after)},
+                )
+                raise FakeSlackError(f"{method}: ratelimited", response)
+            if handler is None:
+                self._fail(method, "unknown_method")
+            data = handler(**kwargs)
+        data["ok"] = True
+        return FakeResponse(data)
+
+    def api_call(self, api_method, json=None, data=None, params=None, **kwargs):
+        """
+        Call API ``api_method`` like ``slack.WebClient.api_call()``.
+        """
+        return self.call(api_method, **(json or data or params or {}))
+
+    def _rate_limit(self, method, channel):
+        # Return the seconds to wait if ``method`` is rate limited, else None
+        limit = self.rate_limits.get(method, self.rate_limits.get("default"))
+        if limit is None:
+            return None
+        key = (method, channel) if method in PER_CHANNEL_METHODS else method
+        per_minute, burst = limit
+        rate = per_minute / 60
+        now = monotonic()
+        tokens, last = self._buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - last) * rate)
+        if tokens < 1:
+            self._buckets[key] = (tokens, now)
+            # Slack sends whole seconds
+            return math.ceil((1 - tokens) / rate)
+        self._buckets[key] = (tokens - 1, now)
+        return None
+
+    def _fail(self, method, error):
+        raise FakeSlackError(
+            f"{method}: {error}", FakeResponse({"ok": False, "error": error}, 200)
+        )
+
+    def _new_ts(self):
+        # unique and increasing microseconds since the epoch, like Slack's
+        self._last_us = max(int(time() * 1e6), self._last_us + 1)
+        return f"{self._last_us // 10**6}.{self._last_us % 10**6:06d}"
+
+    def _message(self, method, channel, ts):
+        if ts not in self.messages.get(channel, {}):
+            self._fail(method, "message_not_found")
+        return self.messages[channel][ts]
+
+    def _auth_test(self, **kwargs):
+        return {"team": "fake", "user": "clusterbot", "user_id": "B0000000"}
+
+    def _users_list(self, limit=None, cursor=None, **kwargs):
+        start = int(cursor or 0)
+        stop = len(self.members) if not limit else start + int(limit)
+        next_cursor = str(stop) if stop < len(self.members) else ""
+        return {
+            "members": self.members[start:stop],
+            "response_metadata": {"next_cursor": next_cursor},
+        }
+
+    def _conversations_open(self, users=None, **kwargs):
+        if users not in self._user_ids:
+            self._fail("conversations.open", "user_not_found")
+        channel = "D" + users[1:]
+        self.messages.setdefault(channel, OrderedDict())
+        return {"channel": {"id": channel}}
+
+    def _chat_postMessage(self, channel=None, text=None, thread_ts=None, **kwargs):
+        if channel not in self.messages:
+            self._fail("chat.postMessage", "channel_not_found")
+        if thread_ts is not None:
+            self._message("chat.postMessage", channel, thread_ts)
+        ts = self._new_ts()
+        self.messages[channel][ts] = {"text": text, "thread_ts": thread_ts}
+        if kwargs.get("metadata") is not None:
+            self.messages[channel][ts]["metadata"] = kwargs["metadata"]
+        return {"channel": channel, "ts": ts}
+
+    def _conversations_history(self, channel=None, oldest=None, **kwargs):
+        if channel not in self.messages:
+            self._fail("conversations.history", "channel_not_found")
+        return self._history(
+            channel,
+            lambda ts, message: message["thread_ts"] in (None, ts),
+            oldest,
+            kwargs,
+        )
+
+    def _conversations_replies(self, channel=None, ts=None, oldest=None, **kwargs):
+        self._message("conversations.replies", channel, ts)
+        thread_ts = ts
+        history = self._history(
+            channel,
+            lambda ts, message: ts == thread_ts or message["thread_ts"] == thread_ts,
+            oldest,
+            kwargs,
+        )
+        # replies are sorted from oldest to newest
+        history["messages"].reverse()
+        return history
+
+    def _history(self, channel, select, oldest, kwargs):
+        # Messages of ``channel`` selected by ``select(ts, message)``, newest first
+        messages = []
+        for ts, message in reversed(self.messages[channel].items()):
+            if oldest is not None and float(ts) < float(oldest):
+                continue
+            if not select(ts, message):
+                continue
+            message = dict(message, ts=ts)
+            if not kwargs.get("include_all_metadata"):
+                message.pop("metadata", None)
+            messages.append(message)
+        limit = int(kwargs.get("limit") or 100)
+        return {"messages": messages[:limit], "has_more": len(messages) > limit}
+
+    def _chat_update(self, channel=None, ts=None, text=None, **kwargs):
+        self._message("chat.update", channel, ts)["text"] = text
+        return {"channel": channel, "ts": ts, "text": text}
+
+    def _chat_delete(self, channel=None, ts=None, **kwargs):
+        self._message("chat.delete", channel, ts)
+        del self.messages[channel][ts]
+        return {"channel": channel, "ts": ts}
+
+    def _files_getUploadURLExternal(self, filename=None, length=None, **kwargs):
+        if not filename or length is None:
+            self._fail("files.getUploadURLExternal", "invalid_arguments")
+        self._n_files += 1
+        file_id = f"F{self._n_files:07d}"
+        self.files[file_id] = {
+            "id": file_id,
+            "name": filename,
+            "size": int(length),
+            "uploaded": False,
+            "shares": {},
+        }
+        return {"upload_url": f"{UPLOAD_URL}{file_id}", "file_id": file_id}
+
+    def post_upload(self, upload_url, source):
+        """
+        Receive the content of ``source`` (an ``UploadSource``) sent to
+        ``upload_url``, as returned by ``files.getUploadURLExternal``.
+
+        ClusterBot uses this instead of an HTTP request if the transport has it.
+        """
+        if self.latency:
+            sleep(self.latency)
+        file_id = upload_url[len(UPLOAD_URL) :]
+        size = sum(len(chunk) for chunk in source.chunks())
+        with self._lock:
+            self.calls["upload_url"] += 1
+            file = self.files.get(file_id)
+            if not upload_url.startswith(UPLOAD_URL) or file is None:
+                self._fail("upload_url", "invalid_upload_url")
+            if size != file["size"]:
+                self._fail("upload_url", "length_mismatch")
+            file["uploaded"] = True
+
+    def _files_completeUploadExternal(
+        self,
+        files=None,
+        channel_id=None,
+        initial_comment=None,
+        thread_ts=None,
+        **kwargs,
+    ):
+        method = "files.completeUploadExternal"
+        if isinstance(files, str):
+            # form encoded
+            files = json.loads(files)
+        if not files:
+            self._fail(method, "invalid_arguments")
+        for file in files:
+            if not self.files.get(file["id"], {}).get("uploaded"):
+                self._fail(method, "file_not_found")
+        if channel_id is None:
+            return {"files": [{"id": file["id"]} for file in files]}
+        if channel_id not in self.messages:
+            self._fail(method, "channel_not_found")
+        if thread_ts is not None:
+            self._message(method, channel_id, thread_ts)
+        ts = self._new_ts()
+        self.messages[channel_id][ts] = {
+            "text": initial_comment,
+            "thread_ts": thread_ts,
+            "files": [file["id"] for file in files],
+        }
+        # Slack shares the files asynchronously
+        visible = monotonic() + self.share_delay
+        for file in files:
+            self.files[file["id"]]["shares"][channel_id] = ([{"ts": ts}], visible)
+        return {"files": [{"id": file["id"]} for file in files]}
+
+    def _files_info(self, file=None, **kwargs):
+        if file not in self.files:
+            self._fail("files.info", "file_not_found")
+        info = dict(self.files[file])
+        now = monotonic()
+        shares = {
+            channel: share
+            for channel, (share, visible) in info.pop("shares").items()
+            if visible <= now
+        }
+        info["shares"] = {"private": shares} if shares else {}
+        return {"file": info}
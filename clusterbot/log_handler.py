@@ -0,0 +1,157 @@
+"""
+Logging handler that sends log records to Slack in batches.
+"""
+
+import atexit
+import logging
+import threading
+
+from .clusterbot import ClusterBot
+
+
+logger = logging.getLogger(__name__)
+
+# Records of these loggers are ignored, since sending them would log again
+IGNORED_LOGGERS = ("clusterbot", "slack")
+
+
+class SlackHandler(logging.Handler):
+    """
+    Logging handler that sends log records to Slack via ClusterBot.
+
+    Records are buffered in memory and sent by a background thread as one message
+    per ``flush_interval`` seconds or per ``max_records`` records, whichever comes
+    first. Records with level ``flush_level`` or higher are sent immediately.
+    Emitting a record never blocks on Slack: if more than ``capacity`` records are
+    waiting to be sent, further records are dropped and only their number is
+    reported (records with level ``flush_level`` or higher replace the oldest
+    waiting record instead).
+
+    Parameters
+    ----------
+    bot : ClusterBot, optional
+        The bot used to send the records. If None, ``ClusterBot()`` is used.
+    level : int, optional
+        Minimal level of records to send.
+    flush_interval : float, optional
+        Maximal time in seconds records are buffered.
+    max_records : int, optional
+        Maximal number of records sent in one message.
+    capacity : int, optional
+        Maximal number of buffered records.
+    flush_level : int, optional
+        Records of this level or higher are sent immediately.
+    reply_to : str, optional
+        The ID (``ts`` value) of the message whose thread the records are sent to.
+    live : bool, optional
+        If True, send the records to a single live log (see ``ClusterBot.stream()``)
+        instead of one message per batch.
+    kwargs : dict, optional
+        Keyword arguments passed to ``ClusterBot.send()``, e.g. ``user_name`` or
+        ``user_id``.
+    """
+
+    def __init__(
+        self,
+        bot=None,
+        level=logging.NOTSET,
+        flush_interval=10.0,
+        max_records=100,
+        capacity=1000,
+        flush_level=logging.WARNING,
+        reply_to=None,
+        live=False,
+        **kwargs,
+    ):
+        super().__init__(level)
+        self.bot = bot if bot is not None else ClusterBot()
+        self.flush_interval = flush_interval
+        self.max_records = max_records
+        self.capacity = capacity
+        self.flush_level = flush_level
+        self.reply_to = reply_to
+        self.kwargs = kwargs
+        self.stream = None
+        if live:
+            self.stream = self.bot.stream(
+                title="Log", reply_to=reply_to, flush_interval=flush_interval, **kwargs
+            )
+        self._buffer = []
+        self._dropped = 0
+        self._buffer_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run, name="clusterbot-log-handler", daemon=True
+        )
+        self._thread.start()
+        # registered after the bot's exit handlers, such that the records are
+        # handed to the bot before it delivers its pending calls
+        atexit.register(self.flush)
+
+    def filter(self, record):
+        if record.name.split(".")[0] in IGNORED_LOGGERS:
+            return False
+        return super().filter(record)
+
+    def emit(self, record):
+        try:
+            message = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+        urgent = record.levelno >= self.flush_level
+        with self._buffer_lock:
+            if len(self._buffer) >= self.capacity:
+                self._dropped += 1
+                if not urgent:
+                    return
+                # make room for the urgent record by dropping the oldest one
+                del self._buffer[0]
+            self._buffer.append(message)
+            if urgent or len(self._buffer) >= self.max_records:
+                self._wakeup.set()
+
+    def flush(self):
+        """
+        Send all buffered records to Slack.
+        """
+        with self._flush_lock:
+            with self._buffer_lock:
+                messages, self._buffer = self._buffer, []
+                dropped, self._dropped = self._dropped, 0
+            if dropped:
+                messages.append(f"... {dropped} log records dropped")
+            for i in range(0, len(messages), self.max_records):
+                self._send("\n".join(messages[i : i + self.max_records]))
+            if self.stream is not None:
+                self.stream.flush()
+
+    def close(self):
+        self._closed = True
+        self._wakeup.set()
+        self._thread.join()
+        self.flush()
+        if self.stream is not None:
+            self.stream.close()
+        # at exit, ``logging.shutdown()`` closes the handler after the bot delivered
+        # its pending calls, wait for the last records (e.g. the traceback that
+        # ended the script) in background mode
+        self.bot.flush()
+        super().close()
+
+    def _send(self, text):
+        if self.stream is not None:
+            self.stream.write(text)
+        else:
+            self.bot._send_now(text, reply_to=self.reply_to, **self.kwargs)
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as error:
+                logger.error(f"Failed to send log records to Slack: {error}")
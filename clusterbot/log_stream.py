@@ -0,0 +1,137 @@
+"""
+Streaming of log lines into Slack messages of bounded size.
+"""
+
+import atexit
+import logging
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+class LogStream(object):
+    """
+    Live log on Slack that lines can be written to, returned by
+    ``ClusterBot.stream()``.
+
+    Written lines are collected and sent every ``flush_interval`` seconds by
+    updating the live message, a reply in the thread of the log. When the live
+    message would grow beyond ``max_chars`` characters, a new reply becomes the
+    live message. Each flush therefore sends at most ``max_chars`` characters, no
+    matter how long the log is.
+
+    Parameters
+    ----------
+    bot : ClusterBot
+        The bot used to send and update the messages.
+    title : str, optional
+        Text of the message starting the thread of the log. Ignored if
+        ``reply_to`` is given.
+    reply_to : str, optional
+        The ID (``ts`` value) of the message whose thread the log is written to.
+    flush_interval : float, optional
+        Time in seconds between two flushes of the written lines.
+    max_chars : int, optional
+        Maximal number of characters of each log message.
+    kwargs : dict, optional
+        Keyword arguments passed to ``ClusterBot.send()`` and
+        ``ClusterBot.update()``, e.g. ``user_name`` or ``user_id``.
+    """
+
+    def __init__(
+        self,
+        bot,
+        title=None,
+        reply_to=None,
+        flush_interval=2.0,
+        max_chars=4000,
+        **kwargs,
+    ):
+        self.bot = bot
+        self.flush_interval = flush_interval
+        self.max_chars = max_chars
+        self.kwargs = kwargs
+        self.root = reply_to
+        if self.root is None:
+            self.root = bot._send_now(title or "Log", **kwargs)
+        # ID, lines and length of the live message
+        self.live_ts = None
+        self._chunk = []
+        self._chunk_chars = 0
+        # True if the live message has lines that weren't delivered yet
+        self._changed = False
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="clusterbot-log-stream", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, text):
+        """
+        Add ``text`` to the log. Multiple lines are split at line breaks.
+        """
+        with self._lock:
+            self._buffer.extend(text.rstrip("\n").split("\n"))
+
+    def flush(self):
+        """
+        Send all written lines to Slack.
+        """
+        with self._flush_lock:
+            with self._lock:
+                lines, self._buffer = self._buffer, []
+            if not lines:
+                return
+            for line in lines:
+                if len(line) > self.max_chars:
+                    line = line[: self.max_chars - 3] + "..."
+                if self._chunk and self._chunk_chars + 1 + len(line) > self.max_chars:
+                    # live message is full, continue in a new reply
+                    if self._changed:
+                        self._deliver()
+                    self.live_ts = None
+                    self._chunk = []
+                    self._chunk_chars = 0
+                if self._chunk:
+                    # line break
+                    self._chunk_chars += 1
+                self._chunk.append(line)
+                self._chunk_chars += len(line)
+                self._changed = True
+            self._deliver()
+
+    def close(self):
+        """
+        Send all written lines and stop the periodic flushing.
+        """
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._thread.join()
+        self.flush()
+
+    def _deliver(self):
+        self._changed = False
+        text = "\n".join(self._chunk)
+        if self.live_ts is None:
+            self.live_ts = self.bot._send_now(text, reply_to=self.root, **self.kwargs)
+        else:
+            self.bot.update(self.live_ts, text, **self.kwargs)
+
+    def _run(self):
+        while not self._closed.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as error:
+                logger.error(f"Failed to send log lines to Slack: {error}")
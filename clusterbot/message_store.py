@@ -0,0 +1,179 @@
+"""
+Bounded store of the texts of sent messages.
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+
+
+logger = logging.getLogger(__name__)
+
+
+class MessageStore(object):
+    """
+    Texts of sent messages by message ID, used to append to messages.
+
+    Messages are kept as lists of lines, such that appending a line is amortized
+    O(1). When more than ``max_messages`` messages or ``max_chars`` characters are
+    stored, the least recently used messages are evicted. Evicted messages are
+    spilled to a SQLite database if ``spill_file`` is given and loaded back when
+    they are used again.
+
+    Parameters
+    ----------
+    max_messages : int, optional
+        Maximal number of messages kept in memory.
+    max_chars : int, optional
+        Maximal number of characters kept in memory.
+    spill_file : str, optional
+        SQLite database file to store evicted messages in. If None, evicted
+        messages are dropped.
+    write_through : bool, optional
+        If True, all messages are written to ``spill_file`` right away (not only
+        when evicted), such that later processes can append to them. Appending then
+        rewrites the whole message in ``spill_file``.
+    """
+
+    def __init__(
+        self, max_messages=1000, max_chars=10**7, spill_file=None, write_through=False
+    ):
+        self.max_messages = max_messages
+        self.max_chars = max_chars
+        self.spill_file = spill_file
+        self.write_through = write_through and spill_file is not None
+        # ts -> list of lines, in order of last use
+        self._messages = OrderedDict()
+        self._chars = 0
+        # IDs of the messages evicted to the spill file (without ``write_through``)
+        self._spilled = set()
+        self._lock = threading.RLock()
+        self._db = None
+        if spill_file is not None:
+            import sqlite3
+
+            self._db = sqlite3.connect(spill_file, timeout=30, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS messages (ts TEXT PRIMARY KEY, text TEXT)"
+            )
+
+    def __contains__(self, ts):
+        with self._lock:
+            return self._lines(ts) is not None
+
+    def __getitem__(self, ts):
+        with self._lock:
+            lines = self._lines(ts)
+            if lines is None:
+                raise KeyError(ts)
+            if len(lines) > 1:
+                # merge the chunks, such that the next read is O(1)
+                lines[:] = ["\n".join(lines)]
+            return lines[0]
+
+    def __setitem__(self, ts, text):
+        with self._lock:
+            self._remove(ts)
+            self._messages[ts] = [text]
+            self._chars += len(text)
+            if self.write_through:
+                self._write(ts, text)
+            self._evict()
+
+    def __delitem__(self, ts):
+        with self._lock:
+            if self._lines(ts) is None:
+                raise KeyError(ts)
+            self._remove(ts)
+            if self.write_through:
+                self._delete(ts)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._messages)
+
+    def get(self, ts, default=None):
+        try:
+            return self[ts]
+        except KeyError:
+            return default
+
+    def append(self, ts, line, text=None):
+        """
+        Append ``line`` as new line to message ``ts``.
+
+        If the caller already joined the old text and ``line`` (e.g. to send it),
+        pass the result as ``text``, which is then stored instead of joining the
+        lines again when the message is read.
+        """
+        with self._lock:
+            lines = self._lines(ts)
+            if lines is None:
+                raise KeyError(ts)
+            if text is None:
+                lines.append(line)
+            else:
+                lines[:] = [text]
+            self._chars += len(line) + 1
+            if self.write_through:
+                self._write(ts, text if text is not None else "\n".join(lines))
+            self._evict()
+
+    def _lines(self, ts):
+        # Return the lines of message ``ts`` (loading it from the spill file) or None
+        lines = self._messages.get(ts)
+        if lines is not None:
+            self._messages.move_to_end(ts)
+            return lines
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            "SELECT text FROM messages WHERE ts = ?", (ts,)
+        ).fetchone()
+        if row is None:
+            return None
+        if not self.write_through:
+            self._spilled.discard(ts)
+            self._delete(ts)
+        lines = self._messages[ts] = [row[0]]
+        self._chars += len(row[0])
+        self._evict()
+        return lines
+
+    def _remove(self, ts):
+        lines = self._messages.pop(ts, None)
+        if lines is not None:
+            self._chars -= sum(len(line) + 1 for line in lines) - 1
+        # only messages that were spilled need to be removed from the spill file,
+        # with ``write_through`` they are replaced by ``_write()``
+        if ts in self._spilled:
+            self._spilled.discard(ts)
+            self._delete(ts)
+
+    def _evict(self):
+        while self._messages and (
+            len(self._messages) > self.max_messages or self._chars > self.max_chars
+        ):
+            if len(self._messages) == 1:
+                # never evict the message in use
+                break
+            ts = next(iter(self._messages))
+            lines = self._messages.pop(ts)
+            text = "\n".join(lines)
+            self._chars -= len(text)
+            if self.write_through:
+                # already stored in the spill file
+                continue
+            if self._db is not None:
+                self._write(ts, text)
+                self._spilled.add(ts)
+            else:
+                logger.debug(f"Evicted message {ts} from the message store.")
+
+    def _write(self, ts, text):
+        self._db.execute("INSERT OR REPLACE INTO messages VALUES (?, ?)", (ts, text))
+        self._db.commit()
+
+    def _delete(self, ts):
+        self._db.execute("DELETE FROM messages WHERE ts = ?", (ts,))
+        self._db.commit()
@@ -0,0 +1,435 @@
+"""
+Durable delivery of Slack calls through a write-ahead journal.
+"""
+
+import os
+import json
+import uuid
+import atexit
+import base64
+import socket
+import logging
+import sqlite3
+import threading
+import itertools
+import urllib.error
+from collections import deque, namedtuple
+from time import time, monotonic
+
+from .background import MessageHandle
+
+
+logger = logging.getLogger(__name__)
+
+# A process that didn't update its heartbeat for this many seconds is considered
+# dead, its pending calls are delivered by another process using the same journal
+STALE_AFTER = 60.0
+HEARTBEAT_INTERVAL = 5.0
+# Maximal delay in seconds between two delivery attempts while Slack is unreachable
+MAX_RETRY_DELAY = 60.0
+# Delivered calls are kept this many seconds, such that later calls can refer to them
+KEEP_DELIVERED = 30 * 24 * 60 * 60
+
+# Call being delivered: its unique ``key``, the time it was recorded, whether an
+# earlier attempt may have reached Slack and the default recipient of the process
+# that recorded it (see ``Outbox.current_call()``)
+OutboxCall = namedtuple("OutboxCall", ["key", "created", "replay", "default_user"])
+
+
+def is_transient(error):
+    """
+    Return True if ``error`` is caused by a network or Slack outage, such that the
+    call can succeed later.
+    """
+    response = getattr(error, "response", None)
+    if response is not None and hasattr(response, "status_code"):
+        # Slack API error (``slack.errors.SlackApiError``)
+        return response.status_code == 429 or response.status_code >= 500
+    return isinstance(
+        error, (urllib.error.URLError, ConnectionError, socket.timeout, socket.gaierror)
+    )
+
+
+def _encode(obj):
+    # JSON encoding of call arguments that aren't JSON types
+    if isinstance(obj, MessageHandle):
+        if obj.done() and isinstance(obj._ts, MessageHandle):
+            # e.g. a sent digest, resolved to the handle of its outbox call
+            return _encode(obj._ts)
+        key = getattr(obj, "_outbox_key", None)
+        if key is None:
+            return obj.result()
+        # resolved to the ``ts`` of the earlier call when delivering
+        return {"__outbox__": key}
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return {"__bytes__": base64.b64encode(obj).decode()}
+    if isinstance(obj, os.PathLike):
+        return os.fspath(obj)
+    raise TypeError(f"Can't record argument of type {type(obj).__name__} in outbox.")
+
+
+class Outbox(object):
+    """
+    Worker that records calls in a SQLite journal before delivering them.
+
+    Has the same interface as ``BackgroundWorker``. Submitted calls are written to
+    the journal by a journal thread (such that the caller never waits for SQLite)
+    and delivered in submission order by a worker thread. While Slack can't be
+    reached, delivery is retried with increasing delays and the script continues.
+    At exit, the worker waits at most ``exit_timeout`` seconds for pending calls.
+    Calls that are still pending are delivered by the next ``Outbox`` using the
+    same journal, e.g. when the job is restarted.
+
+    The journal thread keeps a heartbeat of the process in the journal. Calls of a
+    process whose heartbeat is older than ``STALE_AFTER`` are taken over by another
+    process with the same ``identity`` using the same journal, including the call
+    that was on its way to Slack. Each call has a unique key, which the target can
+    use to check whether an interrupted attempt was delivered before delivering it
+    again. The default recipient of the target (its ``default_user``) is recorded
+    with each call, such that a process taking over a call sends it to the same
+    user (see ``current_call()``).
+
+    Parameters
+    ----------
+    target : object
+        Object whose methods are submitted (the ``ClusterBot``). Calls recorded by
+        an earlier process are delivered by calling the methods of the same name.
+    path : str
+        SQLite file of the journal. Can be shared by concurrent processes.
+    exit_timeout : float, optional
+        Maximal time in seconds to wait for pending calls at exit.
+    identity : str, optional
+        Identifies the Slack token (or relay) calls are made with. Calls are only
+        taken over by processes with the same identity. If None, calls of this
+        process are never taken over by others.
+    """
+
+    def __init__(self, target, path, exit_timeout=10.0, identity=None):
+        self.target = target
+        self.path = os.path.expanduser(path)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.exit_timeout = exit_timeout
+        self.owner = uuid.uuid4().hex
+        self.identity = self.owner if identity is None else identity
+        self._keys = itertools.count()
+        self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS calls (id INTEGER PRIMARY KEY "
+                "AUTOINCREMENT, key TEXT UNIQUE, owner TEXT, func TEXT, args TEXT, "
+                "status TEXT, result TEXT, created REAL, identity TEXT, "
+                "recipient TEXT)"
+            )
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(calls)")}
+            for column in ("identity", "recipient"):
+                # journals written by earlier versions, whose calls are never taken
+                # over since they have no identity
+                if column not in columns:
+                    self._db.execute(f"ALTER TABLE calls ADD COLUMN {column} TEXT")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS owners (owner TEXT PRIMARY KEY, "
+                "heartbeat REAL)"
+            )
+        # handles of the calls submitted by this process, by key
+        self._handles = {}
+        # (key, func name, arguments, time, recipient) of calls not written to the
+        # journal yet
+        self._queue = deque()
+        # keys of calls of this process that another process took over
+        self._taken_over = set()
+        # call delivered by the current thread
+        self._current = threading.local()
+        self._delivered = threading.Condition()
+        self._wakeup = threading.Event()
+        self._journal_wakeup = threading.Event()
+        self._closed = threading.Event()
+        self._heartbeat()
+        self._journal_thread = threading.Thread(
+            target=self._run_journal, name="clusterbot-outbox-journal", daemon=True
+        )
+        self._journal_thread.start()
+        self._thread = threading.Thread(
+            target=self._run, name="clusterbot-outbox", daemon=True
+        )
+        atexit.register(self.close)
+
+    def start(self):
+        """
+        Start delivering calls, once ``target`` is ready to make them. Calls can be
+        submitted before.
+        """
+        self._thread.start()
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Record ``func(*args, **kwargs)`` and return a ``MessageHandle`` for its
+        result. ``func`` has to be a method of ``target``.
+        """
+        if getattr(func, "__self__", None) is not self.target:
+            raise ValueError(f"Can only record methods of {self.target!r} in outbox.")
+        payload = json.dumps([args, kwargs], default=_encode)
+        # calls without recipient go to the default user of this process, also if
+        # another process delivers them
+        recipient = json.dumps(getattr(self.target, "default_user", None))
+        handle = MessageHandle()
+        handle._outbox_key = f"{self.owner}-{next(self._keys)}"
+        self._handles[handle._outbox_key] = handle
+        self._queue.append(
+            (handle._outbox_key, func.__name__, payload, time(), recipient)
+        )
+        self._journal_wakeup.set()
+        return handle
+
+    def current_call(self):
+        """
+        Return the ``OutboxCall`` delivered by the current thread or None.
+        """
+        return getattr(self._current, "call", None)
+
+    def pending(self):
+        """
+        Return the number of calls of this process that weren't delivered yet.
+        """
+        with self._lock:
+            # calls of dead processes taken over by this one
+            adopted = self._db.execute(
+                "SELECT COUNT(*) FROM calls WHERE owner = ? AND "
+                "status IN ('pending', 'sending') AND NOT (key >= ? AND key < ?)",
+                (self.owner, f"{self.owner}-", f"{self.owner}."),
+            ).fetchone()[0]
+        # calls submitted by this process resolve their handle when delivered, also
+        # if another process took them over
+        return len(self._handles) + adopted
+
+    def flush(self, timeout=None):
+        """
+        Block until all recorded calls are delivered, at most ``timeout`` seconds.
+        Returns True if all calls were delivered.
+        """
+        if self._closed.is_set():
+            # nothing is delivered anymore, leave the calls to the next process
+            self._write_queued()
+            return not self.pending()
+        deadline = None if timeout is None else monotonic() + timeout
+        with self._delivered:
+            while self.pending():
+                remaining = HEARTBEAT_INTERVAL
+                if deadline is not None:
+                    remaining = min(remaining, deadline - monotonic())
+                    if remaining <= 0:
+                        return False
+                self._delivered.wait(remaining)
+        return True
+
+    def close(self):
+        """
+        Wait at most ``exit_timeout`` seconds for pending calls and stop delivering.
+        Calls that are still pending are left to the next process.
+        """
+        if self._closed.is_set():
+            return
+        self.flush(self.exit_timeout)
+        self._closed.set()
+        self._wakeup.set()
+        self._journal_wakeup.set()
+        try:
+            self._write_queued()
+        except sqlite3.Error as error:
+            logger.error(f"Failed to record {len(self._queue)} Slack calls: {error}")
+        pending = self.pending()
+        if pending:
+            logger.warning(
+                f"{pending} Slack calls couldn't be delivered, they are kept in "
+                f"{self.path} and delivered by the next ClusterBot using it."
+            )
+        # hand the pending calls to the next process right away
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE owners SET heartbeat = 0 WHERE owner = ?", (self.owner,)
+            )
+
+    def _write_queued(self):
+        # Write the submitted calls to the journal, they are only removed from the
+        # queue once written
+        with self._lock:
+            calls = list(self._queue)
+            if not calls:
+                return
+            with self._db:
+                self._db.executemany(
+                    "INSERT INTO calls (key, owner, func, args, status, created, "
+                    "identity, recipient) VALUES (?, ?, ?, ?, 'pending', ?, ?, ?)",
+                    [
+                        (key, self.owner, func, payload, created, self.identity, user)
+                        for key, func, payload, created, user in calls
+                    ],
+                )
+            for _ in calls:
+                self._queue.popleft()
+        self._wakeup.set()
+
+    def _heartbeat(self):
+        now = time()
+        with self._lock, self._db:
+            if self._closed.is_set():
+                # the pending calls were handed to the next process
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO owners VALUES (?, ?)", (self.owner, now)
+            )
+            # take over the calls of dead processes with the same Slack token, calls
+            # that were on their way to Slack are delivered as replay
+            self._db.execute(
+                "UPDATE calls SET owner = ? WHERE status IN ('pending', 'sending') "
+                "AND identity = ? AND owner NOT IN (SELECT owner FROM owners WHERE "
+                "heartbeat >= ?)",
+                (self.owner, self.identity, now - STALE_AFTER),
+            )
+            self._db.execute(
+                "DELETE FROM owners WHERE heartbeat < ?", (now - STALE_AFTER,)
+            )
+            self._db.execute(
+                "DELETE FROM calls WHERE status NOT IN ('pending', 'sending') AND "
+                "created < ?",
+                (now - KEEP_DELIVERED,),
+            )
+
+    def _check_taken_over(self):
+        # Resolve the handles of calls of this process that another process took
+        # over (while the heartbeat of this process was late) and delivered
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT key, status, result FROM calls WHERE key >= ? AND key < ? "
+                "AND owner != ?",
+                (f"{self.owner}-", f"{self.owner}.", self.owner),
+            ).fetchall()
+        taken_over = set()
+        for key, status, result in rows:
+            handle = self._handles.get(key)
+            if handle is None:
+                continue
+            if status in ("pending", "sending"):
+                taken_over.add(key)
+                continue
+            del self._handles[key]
+            if status == "done":
+                handle._set_result(result)
+            else:
+                handle._set_error(
+                    RuntimeError(f"Outbox call {key} failed in another process.")
+                )
+        if taken_over - self._taken_over:
+            logger.warning(
+                f"{len(taken_over)} Slack calls of this process are delivered by "
+                f"another process using {self.path}."
+            )
+        self._taken_over = taken_over
+        with self._delivered:
+            self._delivered.notify_all()
+
+    def _next_call(self):
+        # Return the next call of this process and mark it as on its way to Slack
+        with self._lock, self._db:
+            row = self._db.execute(
+                "SELECT id, key, func, args, status, created, recipient FROM calls "
+                "WHERE owner = ? AND status IN ('pending', 'sending') ORDER BY id "
+                "LIMIT 1",
+                (self.owner,),
+            ).fetchone()
+            if row is not None:
+                self._db.execute(
+                    "UPDATE calls SET status = 'sending' WHERE id = ?", (row[0],)
+                )
+            return row
+
+    def _finish(self, call_id, status, result=None):
+        with self._lock, self._db:
+            # the arguments are not needed anymore (and can be large)
+            self._db.execute(
+                "UPDATE calls SET status = ?, result = ?, args = NULL WHERE id = ?",
+                (status, result, call_id),
+            )
+        with self._delivered:
+            self._delivered.notify_all()
+
+    def _decode(self, obj):
+        # JSON decoding of call arguments, see ``_encode()``
+        if "__bytes__" in obj:
+            return base64.b64decode(obj["__bytes__"])
+        if "__outbox__" in obj:
+            with self._lock:
+                row = self._db.execute(
+                    "SELECT status, result FROM calls WHERE key = ?",
+                    (obj["__outbox__"],),
+                ).fetchone()
+            if row is None or row[0] != "done":
+                raise RuntimeError(
+                    f"Call refers to outbox call {obj['__outbox__']}, which wasn't "
+                    f"delivered."
+                )
+            return row[1]
+        return obj
+
+    def _run_journal(self):
+        # Write submitted calls to the journal and keep the heartbeat, independent
+        # of how long deliveries take
+        next_heartbeat = monotonic() + HEARTBEAT_INTERVAL
+        while not self._closed.is_set():
+            self._journal_wakeup.wait(max(0.0, next_heartbeat - monotonic()))
+            self._journal_wakeup.clear()
+            try:
+                self._write_queued()
+                if monotonic() >= next_heartbeat:
+                    self._heartbeat()
+                    self._check_taken_over()
+                    next_heartbeat = monotonic() + HEARTBEAT_INTERVAL
+            except sqlite3.Error as error:
+                logger.warning(f"Failed to write outbox journal {self.path}: {error}")
+                self._closed.wait(1.0)
+
+    def _run(self):
+        attempt = 0
+        while not self._closed.is_set():
+            call = self._next_call()
+            if call is None:
+                self._wakeup.wait(HEARTBEAT_INTERVAL)
+                self._wakeup.clear()
+                continue
+
+            call_id, key, func_name, payload, status, created, recipient = call
+            handle = self._handles.get(key)
+            # an earlier attempt may have reached Slack if it was interrupted (the
+            # call was still marked as sending) or failed with a network error
+            self._current.call = OutboxCall(
+                key, created, status == "sending", json.loads(recipient or "null")
+            )
+            try:
+                args, kwargs = json.loads(payload, object_hook=self._decode)
+                result = getattr(self.target, func_name)(*args, **kwargs)
+            except Exception as error:
+                if is_transient(error):
+                    delay = min(MAX_RETRY_DELAY, 2**attempt)
+                    attempt += 1
+                    logger.warning(
+                        f"Slack is unreachable ({error!r}), retrying in {delay}s. "
+                        f"Calls are kept in {self.path} until delivered."
+                    )
+                    self._closed.wait(delay)
+                    continue
+                logger.error(f"Outbox delivery of Slack call failed: {error}")
+                if handle is not None:
+                    self._handles.pop(key, None)
+                    handle._set_error(error)
+                self._finish(call_id, "failed")
+                continue
+            finally:
+                self._current.call = None
+
+            attempt = 0
+            if handle is not None:
+                self._handles.pop(key, None)
+                handle._set_result(result)
+            self._finish(call_id, "done", result if isinstance(result, str) else None)
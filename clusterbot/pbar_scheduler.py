@@ -0,0 +1,120 @@
+"""
+Rendering of multiple progress bars, grouped into as few Slack messages as possible.
+"""
+
+import threading
+
+
+class PbarHandle(object):
+    """
+    Handle of a progress bar on Slack, returned by ``ClusterBot.init_pbar()``.
+    """
+
+    def __init__(self, scheduler, group, pbar):
+        self._scheduler = scheduler
+        self.group = group
+        self.pbar = pbar
+        # latest rendered state of this bar
+        self.output = ""
+
+    @property
+    def ts(self):
+        """
+        ID of the Slack message showing the progress bar.
+        """
+        return self.group.ts
+
+    def update(self, current_value=None, check=False):
+        """
+        Update the progress bar. See ``ClusterBot.update_pbar()`` and
+        ``ProgressBar.update()``.
+        """
+        self._scheduler.update(self, current_value, check=check)
+
+    def finish(self):
+        """
+        Show the current state as final state (e.g. when a loop ended early).
+        """
+        self._scheduler.finish(self)
+
+
+class _PbarGroup(object):
+    # Progress bars rendered into the same Slack message
+    def __init__(self, ts, kwargs):
+        self.ts = ts
+        self.kwargs = kwargs
+        self.handles = []
+
+
+class PbarScheduler(object):
+    """
+    Keeps track of all live progress bars and renders them into Slack messages.
+
+    All progress bars in one group are rendered into the same message and their
+    updates are coalesced, such that each message is updated at most once per
+    interval of the ``coalescer`` no matter how many of its bars changed.
+
+    Parameters
+    ----------
+    send : callable
+        Called as ``send(message, reply_to=ts, **kwargs)`` to send a new message and
+        returns its ID.
+    coalescer : UpdateCoalescer
+        Used to update the progress bar messages.
+    """
+
+    def __init__(self, send, coalescer):
+        self.send = send
+        self.coalescer = coalescer
+        self._lock = threading.Lock()
+
+    def add(self, pbar, group=None, reply_to=None, **kwargs):
+        """
+        Add progress bar ``pbar`` and return its ``PbarHandle``.
+
+        If ``group`` (a ``PbarHandle``) is given, the new bar is shown in the same
+        message as ``group``, otherwise a new message is sent (as reply to
+        ``reply_to``, if given).
+        """
+        if group is None:
+            handle = PbarHandle(self, None, pbar)
+            handle.output = pbar.init()
+            ts = self.send(handle.output, reply_to=reply_to, **kwargs)
+            handle.group = _PbarGroup(ts, kwargs)
+            handle.group.handles.append(handle)
+            return handle
+
+        handle = PbarHandle(self, group.group, pbar)
+        handle.output = pbar.init()
+        with self._lock:
+            handle.group.handles.append(handle)
+            message = self._render(handle.group)
+        self.coalescer.submit(handle.group.ts, message, **handle.group.kwargs)
+        return handle
+
+    def update(self, handle, current_value=None, check=False, **kwargs):
+        """
+        Update the progress bar of ``handle`` and schedule its message for update.
+        """
+        output = handle.pbar.update(current_value, check)
+        if output is None:
+            # throttled by the progress bar, nothing changed on Slack
+            return
+        self._submit(handle, output, kwargs)
+
+    def finish(self, handle, **kwargs):
+        """
+        Render the current state of ``handle`` and schedule its message for update.
+        """
+        self._submit(handle, handle.pbar.finish(), kwargs)
+
+    def _submit(self, handle, output, kwargs):
+        group = handle.group
+        with self._lock:
+            handle.output = output
+            message = self._render(group)
+        # Only the latest state of the message is sent, at most once per interval
+        self.coalescer.submit(group.ts, message, **(kwargs or group.kwargs))
+
+    def _render(self, group):
+        return "".join(handle.output for handle in group.handles)
@@ -3,6 +3,20 @@ from datetime import timedelta
 import os
 
 
+# Width of progress bars sent to Slack, independent of any terminal
+SLACK_WIDTH = 80
+# time format has always 7 letters: `0:00:00`
+TIME_LEN = len("0:00:00")
+# remaining time format has always 20 letters: ` - 0:00:00 remaining"
+REMAINING_LEN = len(" - 0:00:00 remaining")
+NO_REMAINING_TIME = " " * REMAINING_LEN
+# Weight of the latest measurement in the smoothed (EMA) iteration rate
+RATE_SMOOTHING = 0.3
+# Maximal number of updates between two reads of the clock. The number adapts to
+# the update rate, this limits how long a sudden slowdown can go unnoticed.
+MAX_CHECK_INTERVAL = 100
+
+
 # Modified from https://github.com/shackenberg/pbar.py/blob/master/pbar.py
 class ProgressBar(object):
     def __init__(
@@ -15,34 +29,49 @@ class ProgressBar(object):
         width=None,
     ):
         self.width = width
+        # None if the total is unknown, then the count and rate are shown
         self.max_value = max_value
+        self._stop_value = max_value if max_value is not None else float("inf")
         self.start_time = time()
         self.state = start_state
-        self.old_length = self.determine_length_pbar()
+        # the width is resolved once, not on every render
+        self.length = self.determine_length_pbar()
+        self.old_length = self.length
         self.title = self.prepare_title(title)
         self.time_last_update = 0
         self.max_refreshrate = max_refreshrate
         self.is_last_update = False
         self.zero_index = zero_index
+        # smoothed rate of progress in states per second, None until measured
+        self.rate = None
+        # the clock is read every ``_check_interval`` updates
+        self._check_interval = 1
+        self._updates_to_check = 1
+        self._last_check_time = self.start_time
+        self._last_check_state = start_state
+        # (percentage, remaining time) of the last rendered output
+        self._last_visible = None
 
     def init(self):
-        output_string = self.build_output_string(time())
+        current_time = time()
+        self._last_visible = self.visible_state(current_time)
+        output_string = self.render(current_time, *self._last_visible)
         return self.print_pbar(output_string)
 
     def determine_length_pbar(self):
         if self.width is not None:
             return self.width
         else:
-            try:
-                return self.get_width_of_terminal()
-            except:
-                rule_of_thumb_standard_value = 80
-                return rule_of_thumb_standard_value
+            return self.get_width_of_terminal()
 
     def get_width_of_terminal(self):
-        _, ncolumns = os.popen("stty size", "r").read().split()
-        width = int(ncolumns)
-        return width
+        # Checks the ``COLUMNS`` environment variable and the terminal of stdout
+        # without spawning a process. Falls back to 80 columns without a terminal
+        # (e.g. on batch nodes).
+        import shutil
+
+        rule_of_thumb_standard_value = 80
+        return shutil.get_terminal_size((rule_of_thumb_standard_value, 24)).columns
 
     def prepare_title(self, title):
         if title is None:
@@ -50,61 +79,136 @@ class ProgressBar(object):
         else:
             return title + os.linesep
 
-    def update(self, current_value=None):
+    def update(self, current_value=None, check=False):
+        """
+        Set the new state and return the rendered progress bar if it changed.
+
+        Returns None if the output wasn't rendered: the clock is read only every few
+        updates (depending on the update rate, or right away if ``check`` is True,
+        e.g. when the caller already limits the update rate), the output is rendered
+        at most every ``max_refreshrate`` seconds and only if the percentage or
+        remaining time changed. The last update (reaching ``max_value``) is always
+        rendered.
+        """
         if current_value is None:
             self.state += 1
+        elif self.zero_index:
+            self.state = current_value + 1
         else:
-            if self.zero_index:
-                self.state = current_value + 1
-            else:
-                self.state = current_value
-        if self.state > self.max_value:
-            raise ValueError("state >= max_value")
+            self.state = current_value
+        if self.state >= self._stop_value:
+            if self.state > self.max_value:
+                raise ValueError("state >= max_value")
+            return self.finish()
+        self._updates_to_check -= 1
+        if self._updates_to_check and not check:
+            return None
+        return self._check()
+
+    def finish(self):
+        """
+        Render the current state right away, as last update (e.g. when a loop of
+        unknown length ended).
+        """
+        self.is_last_update = True
         current_time = time()
-        time_since_last_update = current_time - self.time_last_update
-        if self.state == self.max_value:
-            self.is_last_update = True
-        if (time_since_last_update > self.max_refreshrate) | self.is_last_update:
-            output_string = self.build_output_string(current_time)
-            self.time_last_update = current_time
-            return self.print_pbar(output_string)
-        if self.is_last_update:
-            self.jump_to_newline()
+        self._last_visible = self.visible_state(current_time)
+        self.time_last_update = current_time
+        return self.print_pbar(self.render(current_time, *self._last_visible))
+
+    def _check(self):
+        # Read the clock, adapt the check interval and render if the output changed
+        self.is_last_update = False
+        current_time = time()
+        elapsed = current_time - self._last_check_time
+        progressed = self.state - self._last_check_state
+        if elapsed > 0:
+            if progressed > 0:
+                rate = progressed / elapsed
+                if self.rate is None:
+                    self.rate = rate
+                else:
+                    self.rate += RATE_SMOOTHING * (rate - self.rate)
+            # read the clock about twice per ``max_refreshrate``, growing the
+            # interval at most by a factor of two per check
+            updates_per_second = self._check_interval / elapsed
+            self._check_interval = max(
+                1,
+                min(
+                    int(updates_per_second * self.max_refreshrate / 2),
+                    2 * self._check_interval,
+                    MAX_CHECK_INTERVAL,
+                ),
+            )
+        else:
+            # faster than the clock resolution
+            self._check_interval = min(2 * self._check_interval, MAX_CHECK_INTERVAL)
+        self._updates_to_check = self._check_interval
+        self._last_check_time = current_time
+        self._last_check_state = self.state
+
+        if current_time - self.time_last_update <= self.max_refreshrate:
+            return None
+        visible = self.visible_state(current_time)
+        if visible == self._last_visible:
+            return None
+        self._last_visible = visible
+        self.time_last_update = current_time
+        return self.print_pbar(self.render(current_time, *visible))
 
     def time_div_to_short_str(self, time_div):
         return str(timedelta(seconds=round(time_div)))
 
     def computed_estimate_time_left(self, complete_elapsed_time):
+        if self.rate:
+            # smoothed recent rate, which follows changes of the iteration speed
+            return (self.max_value - self.state) / self.rate
         estimated_time_left = complete_elapsed_time * (
             self.max_value / float(self.state) - 1
         )
         return estimated_time_left
 
-    def build_output_string(self, current_time):
-        self.length = self.determine_length_pbar()
+    def rate_str(self, current_time):
+        rate = self.rate
+        if rate is None:
+            elapsed = current_time - self.start_time
+            rate = self.state / elapsed if elapsed > 0 else 0.0
+        return f"{rate:.1f}/s" if rate < 100 else f"{rate:.0f}/s"
+
+    def visible_state(self, current_time):
+        # Return (percentage, remaining time string), the output only changes
+        # meaningfully if one of them changes. Without ``max_value``, return
+        # (count, rate string).
+        if self.max_value is None:
+            return self.state, self.rate_str(current_time)
         progress = int(round(self.state * 100.0 / self.max_value))
         complete_elapsed_time = current_time - self.start_time
-        # time format has always 7 letters: `0:00:00`
-        time_len = len("0:00:00")
-        complete_elapsed_time_pretty = (
-            f"{self.time_div_to_short_str(complete_elapsed_time):>{time_len}}"
-        )
-
         if (complete_elapsed_time > 3) & (self.state > 0):
             estimated_time_left = self.computed_estimate_time_left(
                 complete_elapsed_time
             )
-            estimated_time_left_pretty = (
+            estimated_time_left_pretty_formatted = (
                 f" - {self.time_div_to_short_str(estimated_time_left)} remaining"
-            )
+            ).rjust(REMAINING_LEN)
         else:
-            estimated_time_left_pretty = ""
+            estimated_time_left_pretty_formatted = NO_REMAINING_TIME
+        return progress, estimated_time_left_pretty_formatted
 
-        # remaining time format has always 20 letters: ` - 0:00:00 remaining"
-        remaining_len = len(" - 0:00:00 remaining")
-        estimated_time_left_pretty_formatted = (
-            f"{estimated_time_left_pretty:>{remaining_len}}"
-        )
+    def build_output_string(self, current_time):
+        return self.render(current_time, *self.visible_state(current_time))
+
+    def render(self, current_time, progress, estimated_time_left_pretty_formatted):
+        complete_elapsed_time = current_time - self.start_time
+        complete_elapsed_time_pretty = self.time_div_to_short_str(
+            complete_elapsed_time
+        ).rjust(TIME_LEN)
+
+        if self.max_value is None:
+            # ``progress`` is the count and the rate is shown instead of the time
+            # remaining, since there is nothing to fill a bar with
+            count_str = f"{progress} done in {complete_elapsed_time_pretty}"
+            rate_str = f" ({estimated_time_left_pretty_formatted})"
+            return "".join([os.linesep, self.title, "`", count_str, rate_str, "`"])
 
         # progress string has max 3 digits (100%)
         progress_str = f" {progress:3d}% in "
@@ -121,8 +225,7 @@ class ProgressBar(object):
 
         max_bar_length = self.length - overhead
         bar_length = int(progress * max_bar_length / 100)
-        filled = "#" * bar_length
-        progressbar_string = f"[{filled:<{max_bar_length}}]"
+        progressbar_string = "[" + ("#" * bar_length).ljust(max_bar_length) + "]"
 
         backtick = "`"
 
@@ -137,11 +240,7 @@ class ProgressBar(object):
             backtick,
         ]
 
-        output_string = "".join(ordered_output_string_fields)
-
-        self.old_length = self.length
-
-        return output_string
+        return "".join(ordered_output_string_fields)
 
     def print_pbar(self, output_string):
         return output_string
@@ -0,0 +1,412 @@
+"""
+Relay daemon through which many ClusterBots share one Slack connection.
+
+Start the relay with::
+
+    python -m clusterbot.relay unix:///tmp/clusterbot.sock
+
+and connect to it with ``ClusterBot(relay="unix:///tmp/clusterbot.sock")``. The
+relay makes all Slack calls with its own Slack token, shares the rate limits
+between all connected bots, answers identical read-only calls (``auth.test``,
+``users.list``, ``conversations.open``) from a cache and coalesces queued updates
+of the same message.
+
+Bots authenticate with the key of the ``relay_key`` option under the ``[BOT]``
+section of the config files, which a relay listening on TCP requires. Only the
+Slack methods used by ClusterBot are relayed.
+"""
+
+import os
+import hmac
+import json
+import socket
+import logging
+import argparse
+import threading
+import configparser
+import socketserver
+from time import monotonic
+from urllib.parse import urlsplit
+
+from .transport import SlackTransport
+
+
+logger = logging.getLogger(__name__)
+
+# Read-only methods whose responses are shared between all connected bots
+CACHED_METHODS = {"auth.test", "users.list", "conversations.open"}
+# Slack methods used by ClusterBot, other methods are refused
+ALLOWED_METHODS = CACHED_METHODS | {
+    "chat.postMessage",
+    "chat.update",
+    "chat.delete",
+    "conversations.history",
+    "conversations.replies",
+    "files.getUploadURLExternal",
+    "files.completeUploadExternal",
+    "files.info",
+}
+
+
+def parse_address(address):
+    """
+    Parse ``unix:///path`` or ``tcp://host:port`` into ``(family, address)``.
+    """
+    url = urlsplit(address)
+    if url.scheme == "unix":
+        return socket.AF_UNIX, url.netloc + url.path
+    if url.scheme == "tcp":
+        return socket.AF_INET, (url.hostname or "localhost", url.port)
+    raise ValueError(
+        f"Invalid relay address '{address}'. Use 'unix:///path/to/socket' or "
+        f"'tcp://host:port'."
+    )
+
+
+def _auth_digest(key, challenge):
+    # Answer to the ``challenge`` a relay with ``key`` sends on connection
+    return hmac.new(key.encode(), challenge.encode(), "sha256").hexdigest()
+
+
+class RelayError(Exception):
+    """
+    Error raised when the relay could not execute a Slack call.
+
+    The ``response`` attribute holds the Slack response data (if there was one).
+    """
+
+    def __init__(self, message, response):
+        self.response = response
+        super().__init__(message)
+
+
+class RelayResponse(dict):
+    """
+    Response data of a Slack call made by the relay.
+    """
+
+    @property
+    def data(self):
+        return self
+
+
+class RelayTransport(object):
+    """
+    Transport that sends Slack calls to a relay instead of calling Slack directly.
+
+    Has the same ``call()`` interface as ``SlackTransport``.
+
+    Parameters
+    ----------
+    address : str
+        Address of the relay (``unix:///path`` or ``tcp://host:port``).
+    timeout : float, optional
+        Timeout in seconds of socket operations.
+    key : str, optional
+        Shared secret to authenticate with, if the relay requires one.
+    """
+
+    def __init__(self, address, timeout=None, key=None):
+        self.address = address
+        self.family, self.socket_address = parse_address(address)
+        self.timeout = timeout
+        self.key = key
+        self._file = None
+        self._lock = threading.Lock()
+
+    def call(self, method, **kwargs):
+        """
+        Call Slack API ``method`` (e.g. ``"chat.postMessage"``) via the relay.
+        """
+        request = json.dumps({"method": method, "kwargs": kwargs}) + "\n"
+        with self._lock:
+            try:
+                if self._file is None:
+                    self._connect()
+                self._file.write(request.encode())
+                self._file.flush()
+                line = self._file.readline()
+                if not line:
+                    raise ConnectionError("Relay closed the connection.")
+            except OSError:
+                self.close()
+                raise
+        response = json.loads(line)
+        if not response["ok"]:
+            raise RelayError(response["error"], RelayResponse(response["data"] or {}))
+        return RelayResponse(response["data"])
+
+    def close(self):
+        """
+        Close the connection to the relay.
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _connect(self):
+        sock = socket.socket(self.family, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_address)
+        except OSError:
+            sock.close()
+            raise
+        # the file object keeps the socket open
+        self._file = sock.makefile("rwb")
+        sock.close()
+        # the relay greets with a challenge if it requires a key
+        greeting = json.loads(self._file.readline() or "{}")
+        challenge = greeting.get("challenge")
+        if challenge is None:
+            return
+        if self.key is None:
+            self.close()
+            raise RelayError(
+                f"Relay at {self.address} requires a key, set the relay_key option "
+                f"under the [BOT] section of the config files.",
+                RelayResponse(),
+            )
+        answer = json.dumps({"auth": _auth_digest(self.key, challenge)}) + "\n"
+        self._file.write(answer.encode())
+        self._file.flush()
+
+
+class _CachedResponse(object):
+    # Response of a cached call, possibly still in flight
+    def __init__(self):
+        self.created = monotonic()
+        self.event = threading.Event()
+        self.data = None
+        self.error = None
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        key = self.server.relay.key
+        challenge = None if key is None else os.urandom(32).hex()
+        self.wfile.write(json.dumps({"challenge": challenge}).encode() + b"\n")
+        if challenge is not None:
+            answer = json.loads(self.rfile.readline() or "{}").get("auth") or ""
+            if not hmac.compare_digest(answer, _auth_digest(key, challenge)):
+                logger.warning(
+                    f"Refused connection from {self.client_address or 'socket'}: "
+                    f"wrong relay key."
+                )
+                return
+        for line in self.rfile:
+            request = json.loads(line)
+            response = self.server.relay.handle(request["method"], request["kwargs"])
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class _ThreadingUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class RelayServer(object):
+    """
+    Relay that executes the Slack calls of all connected ClusterBots.
+
+    Parameters
+    ----------
+    address : str
+        Address to listen on (``unix:///path`` or ``tcp://host:port``).
+    client : slack.WebClient
+        The client used to make the Slack calls (any object with the same methods,
+        e.g. a fake Slack client for testing).
+    cache_ttl : float, optional
+        Time in seconds for which responses of read-only calls are shared.
+    key : str, optional
+        Shared secret that bots have to authenticate with. Required for TCP
+        addresses, since anyone who can connect could otherwise send messages as
+        the bot.
+    """
+
+    def __init__(self, address, client, cache_ttl=600, key=None):
+        self.address = address
+        self.key = key
+        self.transport = SlackTransport(client)
+        self.cache_ttl = cache_ttl
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+        # expired cache entries are removed at most once per ``cache_ttl``
+        self._next_purge = monotonic() + cache_ttl
+        # (channel, ts) -> [sequence number of latest update, lock, number of
+        # updates in progress], removed once no update is in progress
+        self._updates = {}
+        self._updates_lock = threading.Lock()
+
+        family, socket_address = parse_address(address)
+        if family != socket.AF_UNIX and key is None:
+            raise ValueError(
+                "A relay listening on TCP needs a key, set the relay_key option under "
+                "the [BOT] section of the config files."
+            )
+        if family == socket.AF_UNIX:
+            if os.path.exists(socket_address):
+                os.unlink(socket_address)
+            self._server = _ThreadingUnixServer(socket_address, _RequestHandler)
+        else:
+            self._server = _ThreadingTCPServer(socket_address, _RequestHandler)
+        self._server.relay = self
+
+    @property
+    def server_address(self):
+        return self._server.server_address
+
+    def serve_forever(self):
+        """
+        Handle requests until ``shutdown()`` is called.
+        """
+        logger.info(f"Relay listening on {self.address}.")
+        self._server.serve_forever()
+
+    def shutdown(self):
+        """
+        Stop the relay and close its socket.
+        """
+        self._server.shutdown()
+        self._server.server_close()
+        if self._server.address_family == socket.AF_UNIX:
+            os.unlink(self._server.server_address)
+
+    def handle(self, method, kwargs):
+        """
+        Execute a Slack call and return the response sent back to the bot.
+        """
+        try:
+            if method not in ALLOWED_METHODS:
+                raise RelayError(f"Slack method {method} isn't relayed.", None)
+            if method in CACHED_METHODS:
+                data = self._cached_call(method, kwargs)
+            elif method == "chat.update":
+                data = self._coalesced_update(kwargs)
+            else:
+                data = self.transport.call(method, **kwargs).data
+        except Exception as error:
+            logger.error(f"Relayed Slack call {method} failed: {error}")
+            data = getattr(getattr(error, "response", None), "data", None)
+            return {
+                "ok": False,
+                "error": str(error),
+                "data": data if isinstance(data, dict) else None,
+            }
+        return {"ok": True, "data": data}
+
+    def _cached_call(self, method, kwargs):
+        # Identical calls that are in flight or recent share one Slack call
+        key = (method, json.dumps(kwargs, sort_keys=True))
+        with self._cache_lock:
+            now = monotonic()
+            if now >= self._next_purge:
+                # the relay runs for long, drop entries no bot asked for again
+                for cache_key, entry in list(self._cache.items()):
+                    if now - entry.created > self.cache_ttl:
+                        del self._cache[cache_key]
+                self._next_purge = now + self.cache_ttl
+            cached = self._cache.get(key)
+            owner = cached is None or now - cached.created > self.cache_ttl
+            if owner:
+                cached = self._cache[key] = _CachedResponse()
+        if owner:
+            try:
+                cached.data = self.transport.call(method, **kwargs).data
+            except Exception as error:
+                cached.error = error
+                with self._cache_lock:
+                    del self._cache[key]
+            cached.event.set()
+        cached.event.wait()
+        if cached.error is not None:
+            raise cached.error
+        return cached.data
+
+    def _coalesced_update(self, kwargs):
+        # While an update of a message waits for its turn, newer updates of the same
+        # message replace it
+        key = (kwargs.get("channel"), kwargs.get("ts"))
+        with self._updates_lock:
+            state = self._updates.setdefault(key, [0, threading.Lock(), 0])
+            state[0] += 1
+            state[2] += 1
+            sequence_number = state[0]
+        try:
+            with state[1]:
+                if state[0] != sequence_number:
+                    return {"ok": True, "ts": kwargs.get("ts"), "coalesced": True}
+                return self.transport.call("chat.update", **kwargs).data
+        finally:
+            with self._updates_lock:
+                state[2] -= 1
+                if not state[2]:
+                    # no newer update is waiting
+                    del self._updates[key]
+
+
+def _load_config(user_config_file, system_config_file):
+    # Same lookup of the config files as in ``ClusterBot``
+    config = configparser.ConfigParser()
+    if system_config_file is None:
+        config.read(os.path.expanduser(user_config_file))
+        system_config_file = config.get(
+            "BOT", "system_config_file", fallback="/etc/slack-clusterbot"
+        )
+        config.clear()
+    config.read(
+        [os.path.expanduser(system_config_file), os.path.expanduser(user_config_file)]
+    )
+    return config
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m clusterbot.relay", description=__doc__.split("\n\n")[0]
+    )
+    parser.add_argument(
+        "address", help="address to listen on (unix:///path or tcp://host:port)"
+    )
+    parser.add_argument("--token", help="Slack token (default: from config files)")
+    parser.add_argument("--user-config-file", default="~/.slack-clusterbot")
+    parser.add_argument("--system-config-file", default=None)
+    parser.add_argument(
+        "--base-url", default=None, help="Slack API URL (e.g. of a fake Slack server)"
+    )
+    args = parser.parse_args(argv)
+
+    config = _load_config(args.user_config_file, args.system_config_file)
+    token = args.token
+    if token is None:
+        token = config.get("BOT", "token", fallback=None)
+    if token is None:
+        parser.error("No Slack token given or found in the config files.")
+    key = config.get("BOT", "relay_key", fallback=None)
+    if key is None and parse_address(args.address)[0] != socket.AF_UNIX:
+        parser.error("A relay listening on TCP needs the relay_key config option.")
+
+    import slack
+
+    client_kwargs = {}
+    if args.base_url is not None:
+        client_kwargs["base_url"] = args.base_url
+    client = slack.WebClient(token, **client_kwargs)
+
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s %(name)-12s %(levelname)-8s %(message)s"
+    )
+    server = RelayServer(args.address, client, key=key)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
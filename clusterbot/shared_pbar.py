@@ -0,0 +1,139 @@
+"""
+Progress bar counter that can be shared with worker processes.
+"""
+
+import os
+import logging
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+class SharedPbar(object):
+    """
+    Progress bar that worker processes can increment, returned by
+    ``ClusterBot.init_shared_pbar()``.
+
+    A ``SharedPbar`` can be pickled and passed to worker processes (e.g. as argument
+    of a ``multiprocessing.Pool`` or ``joblib`` task). Workers only send their
+    increments to the process that created the progress bar, which renders it and
+    updates the Slack message. Reporting from many workers therefore costs as many
+    Slack calls as reporting from one.
+
+    Call ``close()`` in the creating process when all workers are done, which
+    processes all outstanding increments.
+    """
+
+    def __init__(self, handle):
+        # multiprocessing is imported when needed, since importing it is slow
+        from multiprocessing.connection import Listener
+
+        self.handle = handle
+        self.count = 0
+        self._owner_pid = os.getpid()
+        self._authkey = os.urandom(16)
+        self._listener = Listener(authkey=self._authkey)
+        self.address = self._listener.address
+        self._lock = threading.Lock()
+        self._closing = False
+        self._readers = []
+        self._accept_thread = threading.Thread(
+            target=self._accept, name="clusterbot-shared-pbar", daemon=True
+        )
+        self._accept_thread.start()
+        # connection to the owner process (used in worker processes)
+        self._conn = None
+        self._conn_pid = None
+
+    def __getstate__(self):
+        # only what workers need to connect to the owner process
+        return {
+            "address": self.address,
+            "_authkey": self._authkey,
+            "_owner_pid": self._owner_pid,
+        }
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._conn = None
+        self._conn_pid = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def update(self, increment=1):
+        """
+        Increment the progress bar by ``increment``.
+        """
+        pid = os.getpid()
+        if pid == self._owner_pid:
+            self._add(increment)
+            return
+        if self._conn is None or self._conn_pid != pid:
+            from multiprocessing.connection import Client
+
+            self._conn = Client(self.address, authkey=self._authkey)
+            self._conn_pid = pid
+        self._conn.send(increment)
+
+    def close(self):
+        """
+        Process all outstanding increments and stop listening for workers.
+
+        Must be called in the process that created the progress bar.
+        """
+        if os.getpid() != self._owner_pid:
+            raise RuntimeError("SharedPbar.close() can only be called by its owner.")
+        if self._closing:
+            return
+        self._closing = True
+        # wake up the accept thread
+        from multiprocessing.connection import Client
+
+        Client(self.address, authkey=self._authkey).close()
+        self._accept_thread.join()
+        self._listener.close()
+        for reader in self._readers:
+            reader.join()
+
+    def _add(self, increment):
+        with self._lock:
+            self.count += increment
+            self.handle.update(self.count - 1)
+
+    def _accept(self):
+        from multiprocessing import AuthenticationError
+
+        while True:
+            try:
+                conn = self._listener.accept()
+            except (OSError, AuthenticationError) as error:
+                logger.debug(f"Shared progress bar failed to accept worker: {error}")
+                continue
+            if self._closing:
+                conn.close()
+                return
+            reader = threading.Thread(target=self._read, args=(conn,), daemon=True)
+            reader.start()
+            self._readers.append(reader)
+
+    def _read(self, conn):
+        with conn:
+            while True:
+                # poll with timeout, such that pending increments are still read
+                # after ``close()`` was called
+                if conn.poll(0.1):
+                    try:
+                        increment = conn.recv()
+                    except EOFError:
+                        return
+                    try:
+                        self._add(increment)
+                    except Exception as error:
+                        logger.error(f"Failed to update shared progress bar: {error}")
+                elif self._closing:
+                    return
@@ -0,0 +1,264 @@
+"""
+Low-overhead statistics of the time spent in Slack calls.
+"""
+
+import logging
+import threading
+from bisect import bisect_left
+from time import monotonic
+
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds of the latency histogram buckets (the last bucket is +Inf)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Kinds of waiting reported by ``SlackStats.add_backoff()``
+BACKOFF_REASONS = ("rate_limit", "retry")
+
+
+class Histogram(object):
+    """
+    Histogram of durations with fixed buckets (see ``LATENCY_BUCKETS``).
+
+    Not thread-safe, ``SlackStats`` serializes the calls.
+    """
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        """
+        Return the upper bound of the bucket of quantile ``q`` (at most ``max``).
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self):
+        """
+        Return a dict of the count, total, mean, quantiles and maximum.
+        """
+        return {
+            "count": self.count,
+            "total_s": self.sum,
+            "mean_s": self.sum / self.count if self.count else 0.0,
+            "p50_s": self.quantile(0.5),
+            "p90_s": self.quantile(0.9),
+            "p99_s": self.quantile(0.99),
+            "max_s": self.max,
+        }
+
+
+class SlackStats(object):
+    """
+    Call counts, errors and latency histograms of Slack calls, per API method and
+    per recipient, and the time spent waiting for rate limits and retries.
+
+    Recording is thread-safe and takes a few microseconds per call.
+    """
+
+    def __init__(self):
+        self.start_time = monotonic()
+        # method -> Histogram
+        self._methods = {}
+        # recipient (channel or user ID) -> Histogram
+        self._recipients = {}
+        # method -> number of failed calls
+        self._errors = {}
+        # (method, reason) -> waited seconds
+        self._backoff = {}
+        self._lock = threading.Lock()
+
+    def add_call(self, method, seconds, recipient=None, error=False):
+        """
+        Record a call of API ``method`` that took ``seconds``.
+        """
+        with self._lock:
+            histogram = self._methods.get(method)
+            if histogram is None:
+                histogram = self._methods[method] = Histogram()
+            histogram.observe(seconds)
+            if recipient is not None:
+                histogram = self._recipients.get(recipient)
+                if histogram is None:
+                    histogram = self._recipients[recipient] = Histogram()
+                histogram.observe(seconds)
+            if error:
+                self._errors[method] = self._errors.get(method, 0) + 1
+
+    def add_backoff(self, method, seconds, reason):
+        """
+        Record that a call of ``method`` waited ``seconds`` because of ``reason``
+        (``"rate_limit"`` or ``"retry"``).
+        """
+        with self._lock:
+            key = (method, reason)
+            self._backoff[key] = self._backoff.get(key, 0.0) + seconds
+
+    def _merged_recipients(self, recipient_names):
+        # Histograms per recipient, with channels replaced by their user
+        merged = {}
+        for recipient, histogram in self._recipients.items():
+            recipient = recipient_names.get(recipient, recipient)
+            if recipient not in merged:
+                merged[recipient] = Histogram()
+            merged[recipient].merge(histogram)
+        return merged
+
+    def snapshot(self, recipient_names=None):
+        """
+        Return the statistics as dict.
+
+        Parameters
+        ----------
+        recipient_names : dict, optional
+            Maps channel IDs to the recipient they are reported as (e.g. the user
+            ID of an IM channel).
+
+        Returns
+        -------
+        stats : dict
+            ``"methods"`` and ``"recipients"`` map API methods and recipients to
+            dicts with ``count``, ``total_s``, ``mean_s``, ``p50_s``, ``p90_s``,
+            ``p99_s`` and ``max_s`` (quantiles are upper bucket bounds), method
+            dicts additionally have ``errors`` and ``backoff_s``. ``total_s`` and
+            ``backoff_s`` are the total time in Slack calls and the part of it spent
+            waiting for rate limits and retries. ``elapsed_s`` is the time since the
+            statistics were started and ``slack_fraction`` the fraction of it spent
+            in Slack calls.
+        """
+        with self._lock:
+            methods = {}
+            for method, histogram in self._methods.items():
+                methods[method] = histogram.summary()
+                methods[method]["errors"] = self._errors.get(method, 0)
+                methods[method]["backoff_s"] = sum(
+                    self._backoff.get((method, reason), 0.0)
+                    for reason in BACKOFF_REASONS
+                )
+            recipients = {
+                recipient: histogram.summary()
+                for recipient, histogram in self._merged_recipients(
+                    recipient_names or {}
+                ).items()
+            }
+            backoff = {
+                reason: sum(
+                    (s for (_, r), s in self._backoff.items() if r == reason), 0.0
+                )
+                for reason in BACKOFF_REASONS
+            }
+        elapsed = monotonic() - self.start_time
+        total = sum(m["total_s"] for m in methods.values())
+        return {
+            "methods": methods,
+            "recipients": recipients,
+            "calls": sum(m["count"] for m in methods.values()),
+            "errors": sum(m["errors"] for m in methods.values()),
+            "total_s": total,
+            "backoff_s": sum(backoff.values()),
+            "rate_limit_wait_s": backoff["rate_limit"],
+            "retry_wait_s": backoff["retry"],
+            "elapsed_s": elapsed,
+            "slack_fraction": total / elapsed if elapsed > 0 else 0.0,
+        }
+
+    def format(self, recipient_names=None):
+        """
+        Return the statistics as human readable table.
+        """
+        stats = self.snapshot(recipient_names)
+        lines = [
+            f"Slack calls: {stats['calls']} ({stats['errors']} failed), "
+            f"{stats['total_s']:.2f}s of {stats['elapsed_s']:.2f}s "
+            f"({stats['slack_fraction']:.1%}), rate limit wait "
+            f"{stats['rate_limit_wait_s']:.2f}s, retry wait "
+            f"{stats['retry_wait_s']:.2f}s",
+            f"{'':32} {'calls':>7} {'errors':>7} {'total':>9} {'mean':>9} "
+            f"{'p90':>9} {'max':>9}",
+        ]
+        for label, rows in [("method", "methods"), ("recipient", "recipients")]:
+            for name, row in sorted(stats[rows].items()):
+                lines.append(
+                    f"{label + ' ' + name:32} {row['count']:7d} "
+                    f"{row.get('errors', 0):7d} {row['total_s']:8.3f}s "
+                    f"{row['mean_s']:8.3f}s {row['p90_s']:8.3f}s {row['max_s']:8.3f}s"
+                )
+        return "\n".join(lines)
+
+    def prometheus(self, recipient_names=None):
+        """
+        Return the statistics in the Prometheus text exposition format.
+        """
+        with self._lock:
+            methods = dict(self._methods)
+            recipients = self._merged_recipients(recipient_names or {})
+            errors = dict(self._errors)
+            backoff = dict(self._backoff)
+        lines = []
+        for name, label, histograms, help_text in [
+            ("clusterbot_slack_call_seconds", "method", methods, "per API method"),
+            (
+                "clusterbot_slack_recipient_call_seconds",
+                "recipient",
+                recipients,
+                "per recipient",
+            ),
+        ]:
+            lines.append(f"# HELP {name} Duration of Slack calls {help_text}.")
+            lines.append(f"# TYPE {name} histogram")
+            for key, histogram in sorted(histograms.items()):
+                labels = f'{label}="{_escape(key)}"'
+                cumulative = 0
+                for bound, count in zip(histogram.bounds, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+                lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+        name = "clusterbot_slack_call_errors_total"
+        lines.append(f"# HELP {name} Failed Slack calls per API method.")
+        lines.append(f"# TYPE {name} counter")
+        for method, count in sorted(errors.items()):
+            lines.append(f'{name}{{method="{_escape(method)}"}} {count}')
+
+        name = "clusterbot_slack_backoff_seconds_total"
+        lines.append(
+            f"# HELP {name} Time Slack calls waited for rate limits and retries."
+        )
+        lines.append(f"# TYPE {name} counter")
+        for (method, reason), seconds in sorted(backoff.items()):
+            lines.append(
+                f'{name}{{method="{_escape(method)}",reason="{reason}"}} {seconds}'
+            )
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    # Escape a Prometheus label value
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -0,0 +1,177 @@
+"""
+Progress bars that follow the iteration over an iterable.
+"""
+
+import logging
+import weakref
+import threading
+from time import monotonic, sleep
+
+
+logger = logging.getLogger(__name__)
+
+# The progress bar is told the count about every this many seconds
+REPORT_INTERVAL = 0.1
+# Maximal number of items between two reports
+MAX_STRIDE = 10000
+# A tracker that didn't report for this many seconds reports on its next item,
+# limits how long a slowdown after a fast phase of the iteration goes unnoticed
+MAX_REPORT_DELAY = 1.0
+
+
+class _Watchdog(object):
+    # Thread that makes trackers that didn't report for ``MAX_REPORT_DELAY`` report
+    # on their next item, the iterating thread only compares the count
+    def __init__(self):
+        self._trackers = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def add(self, tracker):
+        with self._lock:
+            self._trackers.add(tracker)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="clusterbot-track", daemon=True
+                )
+                self._thread.start()
+        self._wakeup.set()
+
+    def discard(self, tracker):
+        with self._lock:
+            self._trackers.discard(tracker)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                trackers = list(self._trackers)
+            if not trackers:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            now = monotonic()
+            for tracker in trackers:
+                if now - tracker._last_report > MAX_REPORT_DELAY:
+                    tracker._next_report = 0
+            del trackers
+            sleep(MAX_REPORT_DELAY / 2)
+
+
+_watchdog = _Watchdog()
+
+
+class Tracker(object):
+    """
+    Iterable that reports the progress of iterating over ``iterable`` to a progress
+    bar, returned by ``ClusterBot.track()``.
+
+    Items are counted in batches: the progress bar is only told the count every
+    ``stride`` items, where ``stride`` adapts to the iteration rate such that it is
+    told about every ``REPORT_INTERVAL`` seconds. If the iteration slows down, the
+    count is told on the next item once ``MAX_REPORT_DELAY`` seconds passed. The
+    Slack message is updated by a background thread, such that iterating costs
+    little more than the bare loop.
+
+    Can be used as context manager, which shows the final count when the block is
+    left (e.g. by ``break`` or an exception). Without ``iterable``, count with
+    ``update()`` instead.
+
+    Parameters
+    ----------
+    handle : PbarHandle
+        The progress bar to report to.
+    iterable : iterable, optional
+        The items to iterate over.
+    """
+
+    def __init__(self, handle, iterable=None):
+        self.handle = handle
+        self.iterable = iterable
+        # number of items done, the progress bar is told at most ``stride`` late
+        self.count = 0
+        self.stride = 1
+        self._next_report = 1
+        # time and count of the last report
+        self._last_report = monotonic()
+        self._last_count = 0
+        self._closed = False
+        _watchdog.add(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.iterable)
+
+    def __iter__(self):
+        if self.iterable is None:
+            raise TypeError("Tracker without iterable can't be iterated over.")
+        count = self.count
+        try:
+            for item in self.iterable:
+                yield item
+                # the item is done once the loop body returns for the next one
+                count += 1
+                if count >= self._next_report:
+                    self.count = count
+                    self._report()
+        finally:
+            self.count = count
+            self.close()
+
+    def update(self, increment=1):
+        """
+        Count ``increment`` more items done.
+        """
+        self.count += increment
+        if self.count >= self._next_report:
+            self._report()
+
+    def close(self):
+        """
+        Show the final count on the progress bar.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        _watchdog.discard(self)
+        self._tell()
+        self.handle.finish()
+
+    def _tell(self):
+        max_value = self.handle.pbar.max_value
+        if max_value is not None and self.count > max_value:
+            # e.g. ``total`` was too small, the bar stays full
+            return
+        if self.count:
+            # progress bars count from zero, reports are already limited in rate
+            self.handle.update(self.count - 1, check=True)
+
+    def _report(self):
+        # Tell the progress bar the count and adapt ``stride`` to the rate
+        self._tell()
+        now = monotonic()
+        elapsed = now - self._last_report
+        if elapsed > MAX_REPORT_DELAY:
+            # forced by the watchdog, the rate since the last report mixes the fast
+            # and the slow phase of the iteration
+            self.stride = 1
+        elif elapsed > 0:
+            items_per_second = (self.count - self._last_count) / elapsed
+            self.stride = max(
+                1,
+                min(
+                    int(items_per_second * REPORT_INTERVAL),
+                    2 * self.stride,
+                    MAX_STRIDE,
+                ),
+            )
+        else:
+            self.stride = min(2 * self.stride, MAX_STRIDE)
+        self._last_report = now
+        self._last_count = self.count
+        self._next_report = self.count + self.stride
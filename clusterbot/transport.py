@@ -0,0 +1,248 @@
+"""
+Rate limit aware transport of Slack API calls with retries.
+"""
+
+import random
+import socket
+import logging
+import threading
+import urllib.error
+from time import monotonic, sleep
+
+
+logger = logging.getLogger(__name__)
+
+# Slack rate limits of the API methods used by ClusterBot as
+# (requests per minute, burst size). See https://api.slack.com/docs/rate-limits
+RATE_LIMITS = {
+    "auth.test": (100, 10),  # Tier 4
+    "users.list": (20, 3),  # Tier 2
+    "conversations.open": (50, 5),  # Tier 3
+    "chat.postMessage": (60, 3),  # Special: 1 per second and channel
+    "chat.update": (50, 5),  # Tier 3
+    "chat.delete": (50, 5),  # Tier 3
+    "files.upload": (20, 3),  # Tier 2
+    "files.getUploadURLExternal": (100, 10),  # Tier 4
+    "files.completeUploadExternal": (100, 10),  # Tier 4
+    "files.info": (100, 10),  # Tier 4
+}
+# Used for methods not listed in ``RATE_LIMITS``
+DEFAULT_RATE_LIMIT = (20, 3)
+# Methods whose rate limit applies per channel
+PER_CHANNEL_METHODS = {"chat.postMessage"}
+# Methods without JSON support, which are sent form-encoded
+FORM_METHODS = {"files.getUploadURLExternal"}
+
+
+class TokenBucket(object):
+    """
+    Thread-safe token bucket that lets calls wait for their turn.
+
+    Parameters
+    ----------
+    rate : float
+        Tokens added per second.
+    capacity : float
+        Maximal number of tokens (burst size).
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last = monotonic()
+        # no tokens are handed out before this time (set by ``pause()``)
+        self._not_before = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take a token, waiting until one is available. Returns the waited time.
+        """
+        wait = self.reserve()
+        if wait > 0:
+            sleep(wait)
+        return wait
+
+    def reserve(self):
+        """
+        Take a token without waiting. Returns the time to wait before using it.
+        """
+        with self._lock:
+            now = monotonic()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._last) * self.rate
+            )
+            self._last = now
+            # tokens can become negative, which reserves future tokens in call order
+            self._tokens -= 1
+            return max(-self._tokens / self.rate, self._not_before - now, 0)
+
+    def pause(self, delay):
+        """
+        Don't hand out tokens for ``delay`` seconds.
+        """
+        with self._lock:
+            self._not_before = max(self._not_before, monotonic() + delay)
+
+
+class SlackTransport(object):
+    """
+    Executes Slack API calls within Slack's rate limits.
+
+    Calls are scheduled with one token bucket per API method (and channel for
+    ``chat.postMessage``). Rate limited calls are retried after the time given in
+    the ``Retry-After`` header, other transient failures (network errors and server
+    errors) are retried with jittered exponential backoff.
+
+    Parameters
+    ----------
+    client : slack.WebClient
+        The client used to make the API calls.
+    max_retries : int, optional
+        Maximal number of retries of a failed call.
+    backoff : float, optional
+        Base delay in seconds of the exponential backoff.
+    max_backoff : float, optional
+        Maximal delay in seconds between two retries.
+    stats : SlackStats, optional
+        If given, the time calls wait for rate limits and retries is added to it.
+    """
+
+    def __init__(
+        self, client, max_retries=5, backoff=1.0, max_backoff=60.0, stats=None
+    ):
+        self.client = client
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.stats = stats
+        self._buckets = {}
+        self._buckets_lock = threading.Lock()
+
+    def call(self, method, **kwargs):
+        """
+        Call Slack API ``method`` (e.g. ``"chat.postMessage"``) with ``kwargs``.
+        """
+        bucket = self._bucket(method, kwargs.get("channel"))
+        attempt = 0
+        while True:
+            wait = bucket.acquire()
+            if wait > 0 and self.stats is not None:
+                self.stats.add_backoff(method, wait, "rate_limit")
+            try:
+                return self._request(method, kwargs)
+            except Exception as error:
+                delay, rate_limited = self._retry_delay(error, attempt)
+                if delay is None or attempt >= self.max_retries:
+                    raise
+                logger.warning(
+                    f"Slack call {method} failed ({error!r}), retrying in "
+                    f"{delay:.1f}s."
+                )
+                if rate_limited:
+                    # let all calls of this method wait
+                    bucket.pause(delay)
+                else:
+                    sleep(delay)
+                    if self.stats is not None:
+                        self.stats.add_backoff(method, delay, "retry")
+                attempt += 1
+
+    def _request(self, method, kwargs):
+        func = getattr(self.client, method.replace(".", "_"), None)
+        if func is None:
+            if method in FORM_METHODS:
+                return self.client.api_call(method, data=kwargs)
+            return self.client.api_call(method, json=kwargs)
+        return func(**kwargs)
+
+    def _bucket(self, method, channel=None):
+        key = (method, channel) if method in PER_CHANNEL_METHODS else method
+        with self._buckets_lock:
+            if key not in self._buckets:
+                per_minute, burst = RATE_LIMITS.get(method, DEFAULT_RATE_LIMIT)
+                self._buckets[key] = TokenBucket(per_minute / 60, burst)
+            return self._buckets[key]
+
+    def _retry_delay(self, error, attempt):
+        # Return (delay, rate_limited), delay is None if the call shouldn't be retried
+        response = getattr(error, "response", None)
+        if response is not None and hasattr(response, "status_code"):
+            # Slack API error (``slack.errors.SlackApiError``)
+            status_code = response.status_code
+            if status_code == 429 or response.get("error") == "ratelimited":
+                headers = response.headers or {}
+                retry_after = headers.get("Retry-After", headers.get("retry-after"))
+                if retry_after is not None:
+                    return float(retry_after), True
+                return self._backoff(attempt), True
+            if status_code >= 500:
+                return self._backoff(attempt), False
+            return None, False
+        if isinstance(error, (urllib.error.URLError, ConnectionError, socket.timeout)):
+            return self._backoff(attempt), False
+        return None, False
+
+    def _backoff(self, attempt):
+        delay = min(self.max_backoff, self.backoff * 2**attempt)
+        return delay * random.uniform(0.5, 1.5)
+
+
+class AsyncSlackTransport(SlackTransport):
+    """
+    Asyncio version of ``SlackTransport``, whose ``call()`` is a coroutine.
+
+    Waiting for the rate limits or for a retry doesn't block the event loop, such
+    that calls to different channels overlap.
+
+    Parameters
+    ----------
+    client : slack.WebClient
+        The client used to make the API calls, created with ``run_async=True``.
+    max_retries, backoff, max_backoff, stats
+        See ``SlackTransport``.
+    """
+
+    async def call(self, method, **kwargs):
+        """
+        Call Slack API ``method`` (e.g. ``"chat.postMessage"``) with ``kwargs``.
+        """
+        # imported here, such that synchronous users don't pay for importing asyncio
+        import asyncio
+
+        bucket = self._bucket(method, kwargs.get("channel"))
+        attempt = 0
+        while True:
+            wait = bucket.reserve()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                if self.stats is not None:
+                    self.stats.add_backoff(method, wait, "rate_limit")
+            try:
+                return await self._request(method, kwargs)
+            except Exception as error:
+                delay, rate_limited = self._retry_delay(error, attempt)
+                if delay is None or attempt >= self.max_retries:
+                    raise
+                logger.warning(
+                    f"Slack call {method} failed ({error!r}), retrying in "
+                    f"{delay:.1f}s."
+                )
+                if rate_limited:
+                    # let all calls of this method wait
+                    bucket.pause(delay)
+                else:
+                    await asyncio.sleep(delay)
+                    if self.stats is not None:
+                        self.stats.add_backoff(method, delay, "retry")
+                attempt += 1
+
+    def _retry_delay(self, error, attempt):
+        # aiohttp is only needed (and imported by slack) once the transport is used
+        import asyncio
+        import aiohttp
+
+        if isinstance(error, (aiohttp.ClientConnectionError, asyncio.TimeoutError)):
+            return self._backoff(attempt), False
+        return super()._retry_delay(error, attempt)
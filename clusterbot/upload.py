@@ -0,0 +1,146 @@
+"""
+Streaming of file contents to Slack's external upload URLs.
+"""
+
+import io
+import os
+import shutil
+import hashlib
+import logging
+import zipfile
+import tempfile
+import urllib.request
+
+
+logger = logging.getLogger(__name__)
+
+# Files are read and sent in chunks of this many bytes
+CHUNK_SIZE = 1024 * 1024
+
+
+class UploadSource(object):
+    """
+    Content of a file to upload, read in chunks of ``CHUNK_SIZE`` bytes.
+
+    Parameters
+    ----------
+    file : str, os.PathLike, bytes, bytearray, memoryview, file object or figure
+        Path of the file, the file content, a binary file object (read from its
+        current position) or a figure with a ``savefig()`` method (e.g. a matplotlib
+        figure), which is saved as PNG in memory. File objects that can't seek are
+        buffered in a temporary file, since Slack needs the length in advance.
+    name : str, optional
+        File name shown in Slack. If None, the name of the path or file object is
+        used (``"figure.png"`` for figures and ``"file"`` for file contents).
+    """
+
+    def __init__(self, file, name=None):
+        # content is read either from ``_file`` or from the memoryview ``_view``
+        self._file = None
+        self._view = None
+        self._close_file = False
+        if isinstance(file, (str, os.PathLike)):
+            self._file = open(file, "rb")
+            self._close_file = True
+            self.length = os.fstat(self._file.fileno()).st_size
+            default_name = os.path.basename(file)
+        elif isinstance(file, (bytes, bytearray, memoryview)):
+            self._view = memoryview(file).cast("B")
+            self.length = self._view.nbytes
+            default_name = "file"
+        elif hasattr(file, "savefig"):
+            buffer = io.BytesIO()
+            file.savefig(buffer, format="png")
+            self._view = buffer.getbuffer()
+            self.length = self._view.nbytes
+            default_name = "figure.png"
+        elif hasattr(file, "read"):
+            self._file = file
+            if not file.seekable():
+                self._file = tempfile.SpooledTemporaryFile(max_size=CHUNK_SIZE)
+                self._close_file = True
+                shutil.copyfileobj(file, self._file, CHUNK_SIZE)
+                self._file.seek(0)
+            start = self._file.tell()
+            self.length = self._file.seek(0, io.SEEK_END) - start
+            self._file.seek(start)
+            default_name = getattr(file, "name", None)
+            if isinstance(default_name, str):
+                default_name = os.path.basename(default_name)
+            else:
+                default_name = "file"
+        else:
+            raise TypeError(f"Can't upload object of type {type(file).__name__}.")
+        self.name = name if name is not None else default_name
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def chunks(self):
+        """
+        Yield the content in chunks of at most ``CHUNK_SIZE`` bytes.
+        """
+        if self._view is not None:
+            for start in range(0, self.length, CHUNK_SIZE):
+                yield self._view[start : start + CHUNK_SIZE]
+            return
+        remaining = self.length
+        while remaining > 0:
+            chunk = self._file.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                raise ValueError(f"File '{self.name}' ended while uploading it.")
+            remaining -= len(chunk)
+            yield chunk
+
+    def digest(self):
+        """
+        Return the SHA-256 hex digest of the content, read in chunks.
+        """
+        sha256 = hashlib.sha256()
+        start = self._file.tell() if self._file is not None else None
+        for chunk in self.chunks():
+            sha256.update(chunk)
+        if start is not None:
+            # read the content again when uploading
+            self._file.seek(start)
+        return sha256.hexdigest()
+
+    def close(self):
+        """
+        Close the file, if it was opened by ``UploadSource``.
+        """
+        if self._close_file:
+            self._file.close()
+
+
+def post_chunks(upload_url, source, timeout=None):
+    """
+    Send the content of ``source`` (an ``UploadSource``) to ``upload_url``, as
+    returned by ``files.getUploadURLExternal``, without loading it into memory.
+    """
+    request = urllib.request.Request(
+        upload_url,
+        data=source.chunks(),
+        headers={
+            "Content-Length": str(source.length),
+            "Content-Type": "application/octet-stream",
+        },
+        method="POST",
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        response.read()
+    logger.debug(f"Sent {source.length} bytes of file '{source.name}' to Slack.")
+
+
+def zip_archive(files):
+    """
+    Return a zip archive (as ``bytes``) of ``files``, given as ``(name, content)``.
+    """
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in files:
+            archive.writestr(name, content)
+    return buffer.getvalue()
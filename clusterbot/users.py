@@ -0,0 +1,130 @@
+"""
+Indexed directory of the members of a Slack workspace.
+"""
+
+import logging
+from collections import namedtuple
+
+
+logger = logging.getLogger(__name__)
+
+# Compact record of a workspace member, only the fields needed by ClusterBot
+Member = namedtuple("Member", ["id", "real_name", "display_name", "email", "deleted"])
+
+
+def member_record(member):
+    """
+    Return the compact ``Member`` record of a ``users.list`` member.
+    """
+    profile = member.get("profile", {})
+    return Member(
+        member["id"],
+        profile.get("real_name") or member.get("real_name"),
+        profile.get("display_name") or None,
+        profile.get("email"),
+        member.get("deleted", False),
+    )
+
+
+class UserDirectory(object):
+    """
+    Members of a Slack workspace, indexed by ID, full name, display name and email.
+
+    Deleted members can only be found by ID.
+
+    Parameters
+    ----------
+    records : iterable of tuple, optional
+        Member records ``(id, real_name, display_name, email, deleted)``.
+    complete : bool, optional
+        Whether ``records`` contains all members of the workspace. Members can be
+        added later with ``add()``.
+    """
+
+    def __init__(self, records=(), complete=False):
+        self.complete = complete
+        # ID -> record
+        self.by_id = {}
+        # name -> list of IDs (names don't need to be unique)
+        self.by_real_name = {}
+        self.by_display_name = {}
+        # email -> ID
+        self.by_email = {}
+        # full names that are used by more than one member
+        self.duplicate_names = set()
+        for record in records:
+            self.add(*record)
+
+    def add(self, user_id, real_name, display_name=None, email=None, deleted=False):
+        """
+        Add a member to the directory.
+        """
+        self.by_id[user_id] = Member(user_id, real_name, display_name, email, deleted)
+        if deleted:
+            return
+        if real_name is not None:
+            ids = self.by_real_name.setdefault(real_name, [])
+            ids.append(user_id)
+            if len(ids) > 1:
+                self.duplicate_names.add(real_name)
+        if display_name is not None:
+            self.by_display_name.setdefault(display_name, []).append(user_id)
+        if email is not None:
+            self.by_email[email.lower()] = user_id
+
+    def records(self):
+        """
+        Return a list of all member records.
+        """
+        return list(self.by_id.values())
+
+    def find(self, user_id=None, user_name=None):
+        """
+        Return ``(user_id, user_name)`` of the member with ``user_id`` or ``user_name``.
+
+        ``user_name`` can be the full name, the display name (optionally prefixed
+        with ``@``) or the email address of the member. If ``user_id`` is given,
+        ``user_name`` is ignored. The returned ``user_name`` is the full name.
+        """
+        if user_id is not None:
+            if user_id not in self.by_id:
+                raise AttributeError(
+                    f"Couldn't find user with ID ``{user_id}`` " "in Slack team."
+                )
+            _user_name = self.by_id[user_id].real_name
+            if user_name is not None and user_name != _user_name:
+                logger.warning(
+                    f"The user name associated with the given user ID "
+                    f"('{_user_name}') is different from the explicitly passed "
+                    f"user name ('{user_name}'). Sending message to the former."
+                )
+            return user_id, _user_name
+
+        if user_name in self.duplicate_names:
+            raise AttributeError(
+                f"Found multiple users with full name '{user_name}' in Slack team. "
+                f"Please provide a user ID in one of the configuration files. You "
+                f"can find your ID in your Slack profile settings."
+            )
+
+        if user_name in self.by_real_name:
+            matching_ids = self.by_real_name[user_name]
+        elif "@" in user_name[1:]:
+            # email address
+            email_id = self.by_email.get(user_name.lower())
+            matching_ids = [] if email_id is None else [email_id]
+        else:
+            matching_ids = self.by_display_name.get(user_name.lstrip("@"), [])
+
+        if len(matching_ids) == 0:
+            raise AttributeError(
+                f"Couldn't find user with name or email '{user_name}' in Slack team."
+            )
+        elif len(matching_ids) > 1:
+            raise AttributeError(
+                f"Found multiple users with display name '{user_name}' in Slack team. "
+                f"Please provide a user ID in one of the configuration files. You "
+                f"can find your ID in your Slack profile settings."
+            )
+        user_id = matching_ids[0]
+        return user_id, self.by_id[user_id].real_name